@@ -1 +1,3 @@
-from .compute import compute_clusters, refine_clusters
+from .compute import compute_clusters, refine_clusters, get_smoothing_model
+from .pockets import group_pockets
+from .cluster_graph import build_cluster_graph, save_cluster_graph, load_cluster_graph, cluster_with_graph, MAX_EPS
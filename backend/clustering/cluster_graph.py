@@ -0,0 +1,152 @@
+import os
+import uuid
+
+import numpy as np
+
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+CLUSTER_GRAPH_FILE = "cluster_graph.npz"
+MAX_EPS = 10.0  # largest DBSCAN eps the stored graph can answer
+
+
+def build_cluster_graph(
+    points: np.ndarray, prediction_scores: np.ndarray, residue_ids: list[str], max_eps: float = MAX_EPS
+) -> dict[str, np.ndarray]:
+    """
+    Precompute the radius graph of the residues, so that the clustering can be repeated for any score threshold
+    and any eps up to `max_eps` without another neighbor search.
+
+    Args:
+        points (np.ndarray): Coordinates of the residues (shape: (N, 3)).
+        prediction_scores (np.ndarray): Prediction score of each residue.
+        residue_ids (list[str]): Identifier of each residue in the format "{chain}_{res_id}".
+        max_eps (float): The largest eps that will be queried.
+
+    Returns:
+        dict[str, np.ndarray]: The graph; every pair of residues (i < j) closer than `max_eps`
+            with their distance, together with the coordinates, the scores and the residue IDs.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+    tree = cKDTree(points)
+    pairs = tree.query_pairs(max_eps, output_type="ndarray")
+
+    rows, columns = pairs[:, 0], pairs[:, 1]
+    distances = np.linalg.norm(points[rows] - points[columns], axis=1)
+
+    return {
+        "rows": rows.astype(np.int32),
+        "columns": columns.astype(np.int32),
+        "distances": distances,
+        "points": points.astype(np.float32),
+        "prediction_scores": np.asarray(prediction_scores, dtype=np.float64),
+        "residue_ids": np.asarray(residue_ids, dtype=str),
+        "max_eps": np.float64(max_eps),
+    }
+
+
+def save_cluster_graph(graph: dict[str, np.ndarray], job_path: str) -> None:
+    """
+    Store the graph in the job directory (next to `results.json`).
+
+    Args:
+        graph (dict[str, np.ndarray]): The graph from `build_cluster_graph`.
+        job_path (str): Path to the job directory.
+    """
+    tmp_path = os.path.join(job_path, f".{uuid.uuid4()}.npz")
+    np.savez(tmp_path, **graph)
+    os.replace(tmp_path, os.path.join(job_path, CLUSTER_GRAPH_FILE))
+
+
+def load_cluster_graph(job_path: str) -> dict[str, np.ndarray] | None:
+    """
+    Load the graph stored in the job directory.
+
+    Args:
+        job_path (str): Path to the job directory.
+
+    Returns:
+        dict[str, np.ndarray] | None: The graph, or None if the job has no graph.
+    """
+    path = os.path.join(job_path, CLUSTER_GRAPH_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def cluster_with_graph(
+    graph: dict[str, np.ndarray], score_threshold: float, eps: float, min_samples: int
+) -> np.ndarray:
+    """
+    Cluster the residues from the precomputed graph, in time linear in the size of the graph.
+
+    Gives the same labels as `compute_clusters` (DBSCAN on the high score residues): a residue with at least
+    `min_samples` neighbors within `eps` (itself included) is a core residue, connected core residues form a cluster,
+    clusters are numbered by their first core residue and a border residue joins the lowest numbered cluster
+    among its core neighbors.
+
+    Args:
+        graph (dict[str, np.ndarray]): The graph from `build_cluster_graph` or `load_cluster_graph`.
+        score_threshold (float): Only the residues with a higher score are clustered.
+        eps (float): Max distance of two neighboring residues (at most the `max_eps` of the graph).
+        min_samples (int): Min number of neighbors of a core residue.
+
+    Returns:
+        np.ndarray: An array of cluster labels for each residue. Residues with no cluster are labeled as -1.
+
+    Raises:
+        ValueError: If eps is larger than the `max_eps` of the graph.
+    """
+    if eps > graph["max_eps"]:
+        raise ValueError(f"eps {eps} is larger than the precomputed maximum ({float(graph['max_eps'])})")
+
+    scores = graph["prediction_scores"]
+    size = len(scores)
+    labels = -1 * np.ones(size, dtype=int)
+
+    high_score_mask = scores > score_threshold
+    # No pockets can be formed if there are not enough high score points.
+    if np.count_nonzero(high_score_mask) < min_samples:
+        return labels
+
+    rows, columns = graph["rows"], graph["columns"]
+    edges = (graph["distances"] <= eps) & high_score_mask[rows] & high_score_mask[columns]
+    rows, columns = rows[edges], columns[edges]
+
+    degrees = np.bincount(rows, minlength=size) + np.bincount(columns, minlength=size) + 1
+    core_mask = high_score_mask & (degrees >= min_samples)
+
+    # connected components of the core residues
+    core_edges = core_mask[rows] & core_mask[columns]
+    adjacency = csr_matrix(
+        (np.ones(np.count_nonzero(core_edges), dtype=bool), (rows[core_edges], columns[core_edges])),
+        shape=(size, size),
+    )
+    _, components = connected_components(adjacency, directed=False)
+
+    # number the clusters by their first core residue
+    core_indices = np.flatnonzero(core_mask)
+    first_core = np.full(components.max() + 1, size)
+    np.minimum.at(first_core, components[core_indices], core_indices)
+    cluster_components = np.flatnonzero(first_core < size)
+    cluster_components = cluster_components[np.argsort(first_core[cluster_components])]
+
+    component_labels = -1 * np.ones(len(first_core), dtype=int)
+    component_labels[cluster_components] = np.arange(len(cluster_components))
+    labels[core_indices] = component_labels[components[core_indices]]
+
+    # border residues (both edge directions), the lowest label of the neighboring clusters wins
+    border_rows = np.concatenate((rows, columns))
+    border_columns = np.concatenate((columns, rows))
+    to_border = core_mask[border_rows] & ~core_mask[border_columns]
+    border_labels = np.full(size, size)
+    np.minimum.at(border_labels, border_columns[to_border], labels[border_rows[to_border]])
+
+    border_mask = border_labels < size
+    labels[border_mask] = border_labels[border_mask]
+
+    return labels
@@ -0,0 +1,34 @@
+import numpy as np
+
+from clustering.compute import compute_clusters
+from clustering.cluster_graph import build_cluster_graph, cluster_with_graph, MAX_EPS
+
+"""This script checks that clustering from the precomputed radius graph gives the same labels as DBSCAN
+(`compute_clusters`) on random structures, for random score thresholds, eps and min_samples.
+Run it from the backend directory: `python -m clustering.cluster_graph_test`."""
+
+np.random.seed(42)
+
+for trial in range(50):
+    length = np.random.randint(10, 1500)
+
+    # a random walk with 3.8 A steps resembles a CA trace
+    steps = np.random.normal(size=(length, 3))
+    coordinates = np.cumsum(3.8 * steps / np.linalg.norm(steps, axis=1, keepdims=True), axis=0).astype(np.float32)
+    scores = np.random.uniform(size=length)
+
+    graph = build_cluster_graph(coordinates, scores, [f"A_{i}" for i in range(length)])
+
+    for _ in range(10):
+        score_threshold = np.random.uniform(0.2, 0.9)
+        eps = np.random.uniform(2.0, MAX_EPS)
+        min_samples = np.random.randint(1, 8)
+
+        expected = compute_clusters(coordinates.tolist(), scores.tolist(), score_threshold, eps, min_samples)
+        labels = cluster_with_graph(graph, score_threshold, eps, min_samples)
+
+        assert np.array_equal(expected, labels), (
+            f"Trial {trial}: labels differ for threshold {score_threshold}, eps {eps}, min_samples {min_samples}"
+        )
+
+print("Clustering from the precomputed graph matches DBSCAN.")
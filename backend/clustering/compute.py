@@ -1,47 +1,88 @@
+import os
 import numpy as np
 import torch
-import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from sklearn.cluster import DBSCAN
 
-from .smoothen_prediction import process_single_sequence, predict_single_sequence, CryptoBenchClassifier
+from .smoothen_prediction import (
+    compute_features,
+    predict_single_sequence,
+    CryptoBenchClassifier,
+    POSITIVE_DISTANCE_THRESHOLD,
+)
+from .neighbor_index import NeighborIndex
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 MODEL_STATE_DICT_PATH = "/app/cryptobench-small/smoothing_model-650M-finetuned.pt"
+SMOOTHENED_THRESHOLD = 0.7  # this is defined by the training data - best F1 score was achieved with this threshold
+
+HIGH_SCORE_THRESHOLD = 0.7  # Threshold to consider a point as high score
+EPS = 5.0  # Max distance for neighbors
+MIN_SAMPLES = 3  # Min points to form a cluster
+
+# build the refinement features of the chains in parallel (helps assemblies with many chains)
+PARALLEL_REFINEMENT = os.getenv("PARALLEL_REFINEMENT", "false").lower() == "true"
+
+_smoothing_model_lock = threading.Lock()
+_smoothing_model: CryptoBenchClassifier | None = None
+
+
+def get_smoothing_model() -> CryptoBenchClassifier:
+    """
+    Get the process-wide smoothing model (loaded on the first call).
+
+    Returns:
+        CryptoBenchClassifier: The shared model instance in eval mode (dropout disabled).
+    """
+    global _smoothing_model
+
+    if _smoothing_model is None:
+        with _smoothing_model_lock:
+            if _smoothing_model is None:
+                model = CryptoBenchClassifier().to(DEVICE)
+                model.load_state_dict(torch.load(MODEL_STATE_DICT_PATH, map_location=DEVICE), strict=True)
+                model.eval()
+                _smoothing_model = model
+
+    return _smoothing_model
 
 
 def compute_clusters(
     points: list[list[float]],
     prediction_scores: list[float],
+    score_threshold: float = HIGH_SCORE_THRESHOLD,
+    eps: float = EPS,
+    min_samples: int = MIN_SAMPLES,
 ):
     """
     Compute clusters based on the given points and prediction scores.
 
     Args:
-        points (list[list[float]]): A list of points, where each point is a list of 3 coordinates [x, y, z].
+        points (list[list[float]] | np.ndarray): Coordinates [x, y, z] of each point.
         prediction_scores (list[float]): A list of prediction scores corresponding to each point.
+        score_threshold (float): Only the points with a higher score are clustered.
+        eps (float): Max distance of two neighboring points (DBSCAN `eps`).
+        min_samples (int): Min number of neighbors of a core point (DBSCAN `min_samples`).
 
     Returns:
         np.ndarray: An array of cluster labels for each point. Points with no cluster are labeled as -1.
     """
 
-    points_array = np.array(points)
+    points_array = np.array(points, dtype=np.float64)
     scores_array = np.array(prediction_scores).reshape(-1, 1)
     stacked = np.hstack((points_array, scores_array))  # Combine coordinates with scores
 
-    HIGH_SCORE_THRESHOLD = 0.7  # Threshold to consider a point as high score
-
-    high_score_mask = stacked[:, 3] > HIGH_SCORE_THRESHOLD
+    high_score_mask = stacked[:, 3] > score_threshold
     high_score_points = stacked[high_score_mask][:, :3]  # Extract only (x, y, z) coordinates
 
-    EPS = 5.0  # Max distance for neighbors
-    MIN_SAMPLES = 3  # Min points to form a cluster
-
     # No pockets can be formed if there are not enough high score points.
-    if len(high_score_points) < MIN_SAMPLES:
+    if len(high_score_points) < min_samples:
         return -1 * np.ones(len(points), dtype=int)
 
-    dbscan = DBSCAN(eps=EPS, min_samples=MIN_SAMPLES)
+    dbscan = DBSCAN(eps=eps, min_samples=min_samples)
     labels = dbscan.fit_predict(high_score_points)
 
     # Initialize all labels to -1
@@ -53,74 +94,164 @@ def compute_clusters(
     return labels
 
 
+def compute_cluster_features(
+    sequence: str, cluster_indices: np.ndarray, embedding: np.ndarray, neighbor_index: NeighborIndex
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build the smoothing features of a single cluster.
+
+    Args:
+        sequence (str): Sequence of the chain.
+        cluster_indices (np.ndarray): Indices of the residues of the cluster in the chain.
+        embedding (np.ndarray): Embeddings of the residues of the chain (float32).
+        neighbor_index (NeighborIndex): Radius-neighbor index of the residues of the chain.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Xs, Ys and idx (see `compute_features`).
+    """
+    binding_residues = [f"{sequence[idx]}{idx}" for idx in cluster_indices]  # Format: residue_type + position
+
+    return compute_features(binding_residues, sequence, embedding, neighbor_index)
+
+
+def compute_chain_features(
+    chain: str,
+    sequence: str,
+    clusters_chain: np.ndarray,
+    points_chain: np.ndarray,
+    embedding_store,
+) -> list[tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Build the smoothing features of every cluster of a chain.
+
+    Args:
+        chain (str): Chain identifier.
+        sequence (str): Sequence of the chain.
+        clusters_chain (np.ndarray): Cluster labels of the residues of the chain.
+        points_chain (np.ndarray): Coordinates of the residues of the chain (shape: (len(sequence), 3)).
+        embedding_store (EmbeddingStore): Job-scoped store holding the embeddings of every chain.
+
+    Returns:
+        list[tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]: (cluster label, cluster indices, Xs, Ys, idx)
+            for every cluster of the chain, in the label order.
+    """
+    cluster_labels = [cluster_label for cluster_label in np.unique(clusters_chain) if cluster_label != -1]
+
+    print(f"Refining clusters for sequence: {sequence} and chain: {chain}")
+
+    # spilled embeddings are float16 memory maps, read them once per chain and compute the features in float32
+    embedding = np.asarray(embedding_store.get(chain), dtype=np.float32)
+    # only the residues closer than POSITIVE_DISTANCE_THRESHOLD are ever used, no need for the dense matrix
+    neighbor_index = NeighborIndex(points_chain, POSITIVE_DISTANCE_THRESHOLD)
+
+    cluster_features = []
+    for cluster_label in cluster_labels:
+        cluster_indices = np.where(clusters_chain == cluster_label)[0]
+
+        print(f"Processing cluster {cluster_label} with {len(cluster_indices)} points.")
+
+        Xs, Ys, idx = compute_cluster_features(sequence, cluster_indices, embedding, neighbor_index)
+        cluster_features.append((cluster_label, cluster_indices, Xs, Ys, idx))
+
+    return cluster_features
+
+
 def refine_clusters(
     clusters: list[int],
     points: list[list[float]],
-    embedding_path_directory: str,
-    structure_file_path: str,
+    embedding_store,
     sequences_by_chain: dict[str, str],
+    parallel: bool = PARALLEL_REFINEMENT,
 ):
     """
     Refine the clusters by applying a machine learning model to smoothen the predictions.
 
+    The clusters are refined one after another (chain by chain, in the label order) and a cluster is refined
+    from its residues left after the earlier clusters. The features of all clusters are built up front and predicted
+    in a single forward pass; only a cluster that lost residues to an earlier one is predicted again on its own.
+
     Args:
         clusters (list[int]): List of cluster labels for each point.
-        points (list[list[float]]): List of points, where each point is a list of 3 coordinates [x, y, z].
-        embedding_path_directory (str): Directory path where embeddings are stored.
-        structure_file_path (str): Path to the structure file.
+        points (list[list[float]]): List of points, where each point is a list of 3 coordinates [x, y, z]
+            (ordered chain by chain, the same way as `sequences_by_chain`).
+        embedding_store (EmbeddingStore): Job-scoped store holding the embeddings of every chain.
         sequences_by_chain (dict[str, str]): Dictionary mapping chain identifiers to their sequences.
+        parallel (bool): Build the features of the chains on a thread pool (one thread per available core).
 
     Returns:
         list[int]: Refined cluster labels for each point."""
 
-    points_array = np.array(points)
-    clusters_new = []
+    model = get_smoothing_model()
+    clusters_array = np.array(clusters, dtype=int)
+    points_array = np.asarray(points, dtype=np.float32)
+
+    # chains with at least one cluster: (chain, sequence, chain offset)
+    chains = []
     processed_residues = 0
 
     for chain, sequence in sequences_by_chain.items():
-        print(f"Refining clusters for sequence: {sequence} and chain: {chain}")
-
-        clusters_chain = clusters[processed_residues : processed_residues + len(sequence)]
-        points_chain = points_array[processed_residues : processed_residues + len(sequence)]
+        if np.any(clusters_array[processed_residues : processed_residues + len(sequence)] != -1):
+            chains.append((chain, sequence, processed_residues))
         processed_residues += len(sequence)
 
-        for cluster_label in np.unique(clusters_chain):
-            if cluster_label == -1:
-                continue
-
-            cluster_points = points_chain[clusters_chain == cluster_label]
-
-            # Skip empty clusters (for some reason, some clusters might be empty)
-            if len(cluster_points) == 0:
+    def features_of_chain(chain_job: tuple[str, str, int]) -> list:
+        chain, sequence, chain_offset = chain_job
+        return compute_chain_features(
+            chain,
+            sequence,
+            clusters_array[chain_offset : chain_offset + len(sequence)],
+            points_array[chain_offset : chain_offset + len(sequence)],
+            embedding_store,
+        )
+
+    # the chains are independent, `map` keeps the chain order so the result is the same as the sequential one
+    if parallel and len(chains) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(chains), len(os.sched_getaffinity(0)))) as executor:
+            chain_features = list(executor.map(features_of_chain, chains))
+    else:
+        chain_features = [features_of_chain(chain_job) for chain_job in chains]
+
+    # features of every cluster of every chain: (cluster label, cluster indices, Xs, Ys, idx)
+    cluster_features = [features for features_of_chain in chain_features for features in features_of_chain]
+
+    if not cluster_features:
+        return clusters_array.tolist()
+
+    # a single forward pass over the residues of all clusters
+    smoothened_prediction = predict_single_sequence(
+        np.concatenate([Xs for _, _, Xs, _, _ in cluster_features]),
+        np.concatenate([Ys for _, _, _, Ys, _ in cluster_features]),
+        np.concatenate([idx for _, _, _, _, idx in cluster_features]),
+        model=model,
+    )
+    predictions = np.atleast_1d(smoothened_prediction["predictions"])
+
+    refined_clusters = clusters_array.copy()
+    offset = 0
+
+    for (chain, sequence, chain_offset), features_of_chain in zip(chains, chain_features):
+        clusters_chain = refined_clusters[chain_offset : chain_offset + len(sequence)]  # a view, updated in place
+        embedding = neighbor_index = None
+
+        for cluster_label, cluster_indices, _, _, idx in features_of_chain:
+            cluster_predictions = predictions[offset : offset + len(idx)]
+            offset += len(idx)
+
+            # an earlier cluster can only take residues away, so a changed cluster has fewer residues
+            remaining_indices = np.where(clusters_chain == cluster_label)[0]
+            if len(remaining_indices) == 0:
                 continue
 
-            print(f"Processing cluster {cluster_label} with {len(cluster_points)} points.")
-
-            model = CryptoBenchClassifier().to(DEVICE)
-            model.load_state_dict(torch.load(MODEL_STATE_DICT_PATH, map_location=DEVICE), strict=True)
-
-            cluster_indices = np.where(clusters_chain == cluster_label)[0]
-
-            binding_residues = [f"{sequence[idx]}{idx}" for idx in cluster_indices]  # Format: residue_type + position
-
-            embedding_file_path = os.path.join(embedding_path_directory, f"embedding_{chain}.npy")
-
-            single_for_prediction = process_single_sequence(
-                binding_residues, sequence, embedding_file_path, structure_file_path, chain
-            )
-
-            smoothened_prediction = predict_single_sequence(*single_for_prediction, model=model)
-
-            SMOOTHENED_THRESHOLD = (
-                0.7  # this is defined by the training data - best F1 score was achieved with this threshold
-            )
-
-            selected_indices = np.where(smoothened_prediction["predictions"] > SMOOTHENED_THRESHOLD)[0]
-            selected_indices_mapped = smoothened_prediction["indices"][selected_indices]
-
-            for idx in selected_indices_mapped:
-                clusters_chain[idx] = cluster_label
+            if len(remaining_indices) < len(cluster_indices):
+                print(f"Cluster {cluster_label} lost residues to an earlier cluster, predicting it again.")
+                if embedding is None:
+                    embedding = np.asarray(embedding_store.get(chain), dtype=np.float32)
+                    neighbor_index = NeighborIndex(
+                        points_array[chain_offset : chain_offset + len(sequence)], POSITIVE_DISTANCE_THRESHOLD
+                    )
+                Xs, Ys, idx = compute_cluster_features(sequence, remaining_indices, embedding, neighbor_index)
+                cluster_predictions = np.atleast_1d(predict_single_sequence(Xs, Ys, idx, model=model)["predictions"])
 
-        clusters_new.extend(clusters_chain)
+            clusters_chain[idx[cluster_predictions > SMOOTHENED_THRESHOLD]] = cluster_label
 
-    return clusters_new
+    return refined_clusters.tolist()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+
+class NeighborIndex:
+    """
+    Sparse radius-neighbor index of the residues of a chain.
+
+    Only the pairs of residues closer than `radius` are stored (O(N·k) memory instead of the O(N²) dense
+    distance matrix), each residue is its own neighbor at distance 0.
+    """
+
+    def __init__(self, coordinates: np.ndarray, radius: float):
+        """
+        Args:
+            coordinates (np.ndarray): Coordinates of the residues (shape: (N, 3)).
+            radius (float): The largest distance that will be queried.
+        """
+        self.size = len(coordinates)
+        self.radius = radius
+
+        tree = cKDTree(np.asarray(coordinates, dtype=np.float64).reshape(-1, 3))
+        pairs = tree.sparse_distance_matrix(tree, radius, output_type="ndarray")
+        pairs = pairs[pairs["v"] < radius]
+
+        self._rows = pairs["i"].astype(np.int32)
+        self._columns = pairs["j"].astype(np.int32)
+        self._distances = pairs["v"].astype(np.float32)
+        self._adjacency: dict[float, csr_matrix] = {}
+
+    def within(self, distance: float) -> csr_matrix:
+        """
+        Get the residues closer than `distance` to each other.
+
+        Args:
+            distance (float): The distance threshold (at most the radius of the index).
+
+        Returns:
+            csr_matrix: Boolean adjacency matrix (shape: (N, N)), entry [i, j] is True if the residues i and j
+                are closer than `distance`.
+
+        Raises:
+            ValueError: If the distance is larger than the radius of the index.
+        """
+        if distance > self.radius:
+            raise ValueError(f"Distance {distance} is larger than the radius of the index ({self.radius})")
+
+        if distance not in self._adjacency:
+            mask = self._distances < distance
+            self._adjacency[distance] = csr_matrix(
+                (np.ones(np.count_nonzero(mask), dtype=bool), (self._rows[mask], self._columns[mask])),
+                shape=(self.size, self.size),
+            )
+
+        return self._adjacency[distance]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the index (the stored pairs and the cached adjacency matrices) in bytes."""
+        return (
+            self._rows.nbytes
+            + self._columns.nbytes
+            + self._distances.nbytes
+            + sum(
+                adjacency.data.nbytes + adjacency.indices.nbytes + adjacency.indptr.nbytes
+                for adjacency in self._adjacency.values()
+            )
+        )
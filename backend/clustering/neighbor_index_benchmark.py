@@ -0,0 +1,64 @@
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from clustering.compute_distance_matrix import compute_distance_matrix
+from clustering.neighbor_index import NeighborIndex
+from clustering.smoothen_prediction import POSITIVE_DISTANCE_THRESHOLD, NEGATIVE_DISTANCE_THRESHOLD
+
+"""This script compares the peak memory and the build time of the dense per-chain distance matrix with the sparse
+radius-neighbor index used by the cluster refinement, on synthetic chains of increasing length.
+The residues are spread uniformly over a globule with the density of a folded protein (~135 A^3 per residue),
+so the number of neighbors within POSITIVE_DISTANCE_THRESHOLD is realistic.
+Run it from the backend directory: `python -m clustering.neighbor_index_benchmark [chain lengths...]`."""
+
+RESIDUE_VOLUME = 135.0  # A^3
+
+
+def globule(length: int) -> np.ndarray:
+    radius = (3 * length * RESIDUE_VOLUME / (4 * np.pi)) ** (1 / 3)
+    directions = np.random.normal(size=(length, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return (directions * radius * np.random.uniform(size=(length, 1)) ** (1 / 3)).astype(np.float32)
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+np.random.seed(42)
+lengths = [int(length) for length in sys.argv[1:]] or [1000, 2000, 4000, 8000]
+
+for length in lengths:
+    coordinates = globule(length)
+
+    distance_matrix, dense_time, dense_peak = measure(lambda: compute_distance_matrix(coordinates))
+
+    def build_index():
+        neighbor_index = NeighborIndex(coordinates, POSITIVE_DISTANCE_THRESHOLD)
+        neighbor_index.within(POSITIVE_DISTANCE_THRESHOLD)
+        neighbor_index.within(NEGATIVE_DISTANCE_THRESHOLD)
+        return neighbor_index
+
+    neighbor_index, sparse_time, sparse_peak = measure(build_index)
+
+    expected = distance_matrix < POSITIVE_DISTANCE_THRESHOLD
+    assert neighbor_index.within(POSITIVE_DISTANCE_THRESHOLD).nnz == np.count_nonzero(expected)
+
+    print(
+        f"{length} residues, {np.count_nonzero(expected) / length:.0f} neighbors per residue: "
+        f"dense {dense_peak / 1024**2:.1f} MB peak / {distance_matrix.nbytes / 1024**2:.1f} MB kept "
+        f"in {dense_time * 1000:.0f} ms, "
+        f"sparse {sparse_peak / 1024**2:.1f} MB peak / {neighbor_index.nbytes / 1024**2:.1f} MB kept "
+        f"in {sparse_time * 1000:.0f} ms"
+    )
+
+    del distance_matrix, expected, neighbor_index
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def group_pockets(
+    clusters: list[int], prediction: list[float], residue_ids: list[str], coordinates: np.ndarray
+) -> tuple[list[int], list[dict]]:
+    """
+    Group the clustered residues into pockets, numbered from 1 by their average prediction (highest first,
+    pockets with the same average keep the order of their first residue).
+
+    Args:
+        clusters (list[int]): Cluster label of each residue (-1 for residues outside of any cluster).
+        prediction (list[float]): CryptoBench score of each residue.
+        residue_ids (list[str]): Identifier of each residue in the format "{chain}_{res_id}".
+        coordinates (np.ndarray): Coordinates of each residue (shape: (N, 3)).
+
+    Returns:
+        tuple: A tuple containing:
+            - clusters (list[int]): The cluster labels renumbered to the pocket IDs.
+            - pockets (list[dict]): The pockets with their residue IDs, predictions, average prediction,
+              centroid and extent (size of the bounding box along each axis).
+    """
+    labels = np.asarray(clusters, dtype=int)
+    in_pocket = np.flatnonzero(labels != -1)
+
+    if len(in_pocket) == 0:
+        return labels.tolist(), []
+
+    # `inverse` maps every pocket residue to its cluster in `cluster_labels`
+    cluster_labels, first_residue, inverse = np.unique(labels[in_pocket], return_index=True, return_inverse=True)
+
+    # residues of each cluster, in the residue order
+    members = in_pocket[np.argsort(inverse, kind="stable")]
+    members_by_cluster = np.split(members, np.cumsum(np.bincount(inverse))[:-1])
+
+    residue_ids_array = np.asarray(residue_ids, dtype=str)
+    prediction_array = np.asarray(prediction, dtype=np.float64)
+    coordinates_array = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+
+    pockets = []
+    for cluster_members in members_by_cluster:
+        cluster_prediction = prediction_array[cluster_members].tolist()
+        cluster_coordinates = coordinates_array[cluster_members]
+
+        pockets.append(
+            {
+                "pocket_id": 0,
+                "residue_ids": residue_ids_array[cluster_members].tolist(),
+                "prediction": cluster_prediction,
+                "average_prediction": sum(cluster_prediction) / len(cluster_prediction),
+                "centroid": cluster_coordinates.mean(axis=0).tolist(),
+                "extent": np.ptp(cluster_coordinates, axis=0).tolist(),
+            }
+        )
+
+    # rank the clusters by the average prediction (stable, in the order of their first residue)
+    average_prediction = np.array([pocket["average_prediction"] for pocket in pockets])
+    appearance_order = np.argsort(first_residue, kind="stable")
+    ranking = appearance_order[np.argsort(-average_prediction[appearance_order], kind="stable")]
+
+    pocket_ids = np.empty(len(cluster_labels), dtype=int)
+    pocket_ids[ranking] = np.arange(1, len(cluster_labels) + 1)
+
+    for cluster, pocket in enumerate(pockets):
+        pocket["pocket_id"] = int(pocket_ids[cluster])
+
+    renumbered = labels.copy()
+    renumbered[in_pocket] = pocket_ids[inverse]
+
+    return renumbered.tolist(), [pockets[cluster] for cluster in ranking]
@@ -0,0 +1,101 @@
+import numpy as np
+import torch
+
+from clustering import compute
+from clustering.compute import compute_clusters, refine_clusters, SMOOTHENED_THRESHOLD
+from clustering.neighbor_index import NeighborIndex
+from clustering.smoothen_prediction import (
+    compute_features,
+    predict_single_sequence,
+    CryptoBenchClassifier,
+    POSITIVE_DISTANCE_THRESHOLD,
+)
+
+"""This script checks that the batched cluster refinement (a single forward pass over all clusters) gives the same
+labels as the sequential loop calling `predict_single_sequence` once per cluster (kept below as the reference),
+including the clusters that lose residues to an earlier cluster.
+The smoothing model is randomly initialized, the labels do not depend on the trained weights.
+Run it from the backend directory: `python -m clustering.refinement_test`."""
+
+
+def reference_refinement(clusters, points, embeddings, sequences_by_chain, model):
+    clusters_new = []
+    processed_residues = 0
+    shrunk_clusters = 0
+
+    for chain, sequence in sequences_by_chain.items():
+        clusters_chain = np.array(clusters[processed_residues : processed_residues + len(sequence)])
+        points_chain = points[processed_residues : processed_residues + len(sequence)]
+        processed_residues += len(sequence)
+
+        neighbor_index = NeighborIndex(points_chain, POSITIVE_DISTANCE_THRESHOLD)
+        initial_clusters_chain = clusters_chain.copy()
+
+        for cluster_label in np.unique(clusters_chain):
+            if cluster_label == -1:
+                continue
+
+            cluster_indices = np.where(clusters_chain == cluster_label)[0]
+            if len(cluster_indices) == 0:
+                continue
+            if len(cluster_indices) < np.count_nonzero(initial_clusters_chain == cluster_label):
+                shrunk_clusters += 1
+
+            binding_residues = [f"{sequence[idx]}{idx}" for idx in cluster_indices]
+            smoothened_prediction = predict_single_sequence(
+                *compute_features(binding_residues, sequence, embeddings[chain], neighbor_index), model=model
+            )
+
+            selected_indices = np.where(np.atleast_1d(smoothened_prediction["predictions"]) > SMOOTHENED_THRESHOLD)[0]
+            for idx in smoothened_prediction["indices"][selected_indices]:
+                clusters_chain[idx] = cluster_label
+
+        clusters_new.extend(clusters_chain.tolist())
+
+    return clusters_new, shrunk_clusters
+
+
+np.random.seed(42)
+torch.manual_seed(42)
+amino_acids = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+
+model = CryptoBenchClassifier()
+with torch.no_grad():
+    model.layer_3.weight.mul_(20)  # spread the random predictions around the threshold
+model.eval()
+compute._smoothing_model = model
+
+total_shrunk_clusters = 0
+total_refined_residues = 0
+
+for trial in range(20):
+    sequences_by_chain = {}
+    embeddings = {}
+    chain_points = []
+
+    for chain in "ABC"[: np.random.randint(1, 4)]:
+        length = np.random.randint(30, 300)
+        sequences_by_chain[chain] = "".join(np.random.choice(amino_acids, size=length))
+        embeddings[chain] = np.random.normal(size=(length, 1280)).astype(np.float32)
+
+        # a random walk with 3.8 A steps resembles a CA trace
+        steps = np.random.normal(size=(length, 3))
+        chain_points.append(np.cumsum(3.8 * steps / np.linalg.norm(steps, axis=1, keepdims=True), axis=0))
+
+    points = np.concatenate(chain_points).astype(np.float32)
+    scores = np.random.uniform(size=len(points))
+    clusters = [int(label) for label in compute_clusters(points, scores, 0.6)]
+
+    expected, shrunk_clusters = reference_refinement(clusters, points, embeddings, sequences_by_chain, model)
+    for parallel in (False, True):
+        refined = refine_clusters(clusters, points, embeddings, sequences_by_chain, parallel=parallel)
+        assert refined == expected, f"Trial {trial}: the batched refinement differs (parallel={parallel})"
+
+    total_shrunk_clusters += shrunk_clusters
+    total_refined_residues += sum(1 for before, after in zip(clusters, expected) if before != after)
+
+print(
+    f"The batched refinement matches the per-cluster loop ({total_refined_residues} relabeled residues, "
+    f"{total_shrunk_clusters} clusters lost residues to an earlier cluster)."
+)
+assert total_refined_residues > 0 and total_shrunk_clusters > 0, "the trials do not exercise the refinement"
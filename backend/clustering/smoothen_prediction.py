@@ -1,9 +1,7 @@
 import torch
 import numpy as np
-import os
 
-
-from .compute_distance_matrix import compute_distance_matrix_from_structure
+from .neighbor_index import NeighborIndex
 
 POSITIVE_DISTANCE_THRESHOLD = 15
 NEGATIVE_DISTANCE_THRESHOLD = 10
@@ -15,65 +13,58 @@ ESM2_DIM = 1280 * 2
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-def process_single_sequence(
-    binding_residues: list[str], sequence: str, embedding_path: str, structure_file_path: str, chain: str
-):
+def compute_features(binding_residues: list[str], sequence: str, embedding: np.ndarray, neighbor_index: NeighborIndex):
     """
-    Process a single sequence to extract features and labels for inference.
+    Build the smoothing features for the binding residues and their negative neighbors.
+
+    Every binding residue is a positive example, every other residue closer than NEGATIVE_DISTANCE_THRESHOLD
+    to some binding residue is a negative example. The features of a residue are its embedding concatenated
+    with the mean embedding of the binding residues closer than POSITIVE_DISTANCE_THRESHOLD.
+    The neighborhoods come from the sparse radius-neighbor index of the chain and the means of all residues
+    are computed with a single sparse matrix product.
 
     Args:
         binding_residues (list[str]): List of binding residues in the format "A123" (residue type + id).
         sequence (str): Amino acid sequence of the protein.
-        embedding_path (str): Path to the precomputed embedding for the given chain.
-        structure_file_path (str): Path to the structure file.
-        chain (str): Chain identifier for the sequence.
+        embedding (np.ndarray): Precomputed embedding for the given chain (shape: (len(sequence), hidden_dim)).
+        neighbor_index (NeighborIndex): Radius-neighbor index of the residues of the chain
+            (radius of at least POSITIVE_DISTANCE_THRESHOLD).
 
     Returns:
         tuple: A tuple containing:
-            - Xs (np.ndarray): Feature matrix for the residues.
+            - Xs (np.ndarray): Feature matrix for the residues (positives in the input order, then negatives ascending).
             - Ys (np.ndarray): Labels for the residues (1 for positive, 0 for negative).
             - idx (np.ndarray): Indices of the residues in the sequence.
     """
-    if not os.path.exists(embedding_path):
-        raise FileNotFoundError(f"Embedding file for not found in {embedding_path}")
+    binding_residues_indices = np.array([int(residue[1:]) for residue in binding_residues], dtype=np.int64)
 
-    embedding = np.load(embedding_path)
-    distance_matrix = compute_distance_matrix_from_structure(structure_file_path, chain)
+    for aa, residue_idx in zip((residue[0] for residue in binding_residues), binding_residues_indices):
+        assert sequence[residue_idx] == aa
 
-    Xs = []
-    Ys = []
-    idx = []
+    binding_mask = np.zeros(len(sequence), dtype=bool)
+    binding_mask[binding_residues_indices] = True
 
-    binding_residues_indices = [int(residue[1:]) for residue in binding_residues]
+    negative_mask = np.zeros(len(sequence), dtype=bool)
+    negative_mask[neighbor_index.within(NEGATIVE_DISTANCE_THRESHOLD)[binding_residues_indices].indices] = True
+    negative_examples_indices = np.flatnonzero(negative_mask & ~binding_mask)
 
-    negative_examples_indices = set()
+    idx = np.concatenate((binding_residues_indices, negative_examples_indices))
 
-    for aa, residue_idx in [(residue[0], int(residue[1:])) for residue in binding_residues]:
-        assert sequence[residue_idx] == aa
-        close_residues_indices = np.where(distance_matrix[residue_idx] < POSITIVE_DISTANCE_THRESHOLD)[0]
-        close_binding_residues_indices = np.intersect1d(close_residues_indices, binding_residues_indices)
+    # close_binding[i, j] is nonzero if the residue j is a binding residue close to the i-th selected residue
+    close_binding = neighbor_index.within(POSITIVE_DISTANCE_THRESHOLD)[idx].astype(embedding.dtype)
+    close_binding.data *= binding_mask[close_binding.indices]
+    close_binding.eliminate_zeros()
+    neighbor_means = (close_binding @ embedding) / np.asarray(close_binding.sum(axis=1))
 
-        concatenated_embedding = np.concatenate(
-            (embedding[residue_idx], np.mean(embedding[close_binding_residues_indices], axis=0))
-        )
-        Xs.append(concatenated_embedding)
-        Ys.append(1)  # positive example
-        idx.append(residue_idx)
-
-        really_close_residues_indices = np.where(distance_matrix[residue_idx] < NEGATIVE_DISTANCE_THRESHOLD)[0]
-        negative_examples_indices.update(set(list(really_close_residues_indices)) - set(list(binding_residues_indices)))
-
-    for residue_idx in negative_examples_indices:
-        close_residues_indices = np.where(distance_matrix[residue_idx] < POSITIVE_DISTANCE_THRESHOLD)[0]
-        close_binding_residues_indices = np.intersect1d(close_residues_indices, binding_residues_indices)
-        concatenated_embedding = np.concatenate(
-            (embedding[residue_idx], np.mean(embedding[close_binding_residues_indices], axis=0))
+    Xs = np.concatenate((embedding[idx], neighbor_means.astype(embedding.dtype)), axis=1)
+    Ys = np.concatenate(
+        (
+            np.ones(len(binding_residues_indices), dtype=np.int64),
+            np.zeros(len(negative_examples_indices), dtype=np.int64),
         )
-        Xs.append(concatenated_embedding)
-        Ys.append(0)
-        idx.append(residue_idx)
+    )
 
-    return np.array(Xs), np.array(Ys), np.array(idx)
+    return Xs, Ys, idx
 
 
 def predict_single_sequence(Xs, Ys, idx, model):
@@ -83,7 +74,7 @@ def predict_single_sequence(Xs, Ys, idx, model):
         Xs (np.ndarray): Feature matrix for the residues.
         Ys (np.ndarray): Labels for the residues (1 for positive, 0 for negative).
         idx (np.ndarray): Indices of the residues in the sequence.
-        model (CryptoBenchClassifier): The trained model for prediction.
+        model (CryptoBenchClassifier): The trained model for prediction (in eval mode).
 
     Returns:
         dict: A dictionary containing:
@@ -94,8 +85,9 @@ def predict_single_sequence(Xs, Ys, idx, model):
     Ys = torch.tensor(Ys, dtype=torch.int64).to(device)
     idx = torch.tensor(idx, dtype=torch.int64).to(device)
 
-    test_logits = model(Xs).squeeze()
-    test_pred = torch.sigmoid(test_logits)
+    with torch.inference_mode():
+        test_logits = model(Xs).squeeze()
+        test_pred = torch.sigmoid(test_logits)
 
     return {"predictions": test_pred.detach().cpu().numpy(), "indices": idx.detach().cpu().numpy()}
 
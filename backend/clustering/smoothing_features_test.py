@@ -0,0 +1,82 @@
+import numpy as np
+
+from clustering.neighbor_index import NeighborIndex
+from clustering.smoothen_prediction import (
+    compute_features,
+    POSITIVE_DISTANCE_THRESHOLD,
+    NEGATIVE_DISTANCE_THRESHOLD,
+)
+
+"""This script checks that the vectorized feature construction of the smoothing model gives the same output
+as the original loop-based implementation (kept below as the reference, on the dense distance matrix)
+on random chains and pockets.
+The negative examples are compared in ascending order, the reference iterates over a Python set.
+Run it from the backend directory: `python -m clustering.smoothing_features_test`."""
+
+
+def reference_features(binding_residues, sequence, embedding, distance_matrix):
+    Xs = []
+    Ys = []
+    idx = []
+
+    binding_residues_indices = [int(residue[1:]) for residue in binding_residues]
+
+    negative_examples_indices = set()
+
+    for aa, residue_idx in [(residue[0], int(residue[1:])) for residue in binding_residues]:
+        assert sequence[residue_idx] == aa
+        close_residues_indices = np.where(distance_matrix[residue_idx] < POSITIVE_DISTANCE_THRESHOLD)[0]
+        close_binding_residues_indices = np.intersect1d(close_residues_indices, binding_residues_indices)
+
+        concatenated_embedding = np.concatenate(
+            (embedding[residue_idx], np.mean(embedding[close_binding_residues_indices], axis=0))
+        )
+        Xs.append(concatenated_embedding)
+        Ys.append(1)  # positive example
+        idx.append(residue_idx)
+
+        really_close_residues_indices = np.where(distance_matrix[residue_idx] < NEGATIVE_DISTANCE_THRESHOLD)[0]
+        negative_examples_indices.update(set(list(really_close_residues_indices)) - set(list(binding_residues_indices)))
+
+    for residue_idx in sorted(negative_examples_indices):
+        close_residues_indices = np.where(distance_matrix[residue_idx] < POSITIVE_DISTANCE_THRESHOLD)[0]
+        close_binding_residues_indices = np.intersect1d(close_residues_indices, binding_residues_indices)
+        concatenated_embedding = np.concatenate(
+            (embedding[residue_idx], np.mean(embedding[close_binding_residues_indices], axis=0))
+        )
+        Xs.append(concatenated_embedding)
+        Ys.append(0)
+        idx.append(residue_idx)
+
+    return np.array(Xs), np.array(Ys), np.array(idx)
+
+
+np.random.seed(42)
+amino_acids = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+
+for trial in range(50):
+    length = np.random.randint(10, 600)
+    sequence = "".join(np.random.choice(amino_acids, size=length))
+    embedding = np.random.normal(size=(length, 1280)).astype(np.float32)
+
+    # a random walk with 3.8 A steps resembles a CA trace
+    steps = np.random.normal(size=(length, 3))
+    coordinates = np.cumsum(3.8 * steps / np.linalg.norm(steps, axis=1, keepdims=True), axis=0).astype(np.float32)
+    distance_matrix = np.linalg.norm(coordinates[:, np.newaxis] - coordinates[np.newaxis, :], axis=-1)
+
+    pocket_size = np.random.randint(1, min(length, 40))
+    pocket = np.sort(np.random.choice(length, size=pocket_size, replace=False))
+    binding_residues = [f"{sequence[i]}{i}" for i in pocket]
+
+    reference_Xs, reference_Ys, reference_idx = reference_features(
+        binding_residues, sequence, embedding, distance_matrix
+    )
+    neighbor_index = NeighborIndex(coordinates, POSITIVE_DISTANCE_THRESHOLD)
+    Xs, Ys, idx = compute_features(binding_residues, sequence, embedding, neighbor_index)
+
+    assert np.array_equal(reference_idx, idx), f"Trial {trial}: residue indices differ"
+    assert np.array_equal(reference_Ys, Ys), f"Trial {trial}: labels differ"
+    assert reference_Xs.dtype == Xs.dtype and reference_Xs.shape == Xs.shape, f"Trial {trial}: features differ"
+    assert np.allclose(reference_Xs, Xs, atol=1e-5), f"Trial {trial}: features differ"
+
+print("The vectorized feature construction matches the reference implementation.")
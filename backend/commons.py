@@ -2,3 +2,7 @@ import os
 
 APP_BASE_PATH = "/app/data"
 JOBS_BASE_PATH = os.path.join(APP_BASE_PATH, "jobs")
+
+# bump when the same input gives different results, the cached results of older versions are recomputed
+# 2: the cluster refinement runs (the smoothing model never changed the clusters before)
+RESULTS_VERSION = 2
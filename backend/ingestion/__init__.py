@@ -0,0 +1,11 @@
+from .structure import (
+    ingest_structure,
+    read_structure,
+    build_residue_table,
+    save_residue_table,
+    load_residue_table,
+    get_chain_order,
+    get_sequences_by_chain,
+    get_residue_ids,
+    RESIDUE_TABLE_FILE,
+)
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+import biotite.structure.io.pdbx as pdbx
+
+"""This script compares the size and the parse time (file read + first model extraction) of BinaryCIF
+and plain-text mmCIF files of the same entries. The fixture directory holds pairs of files named
+`<id>.bcif` and `<id>.cif` (e.g. large assemblies downloaded once from RCSB PDB).
+Run it from the backend directory: `python -m ingestion.bcif_benchmark <fixture directory>`."""
+
+REPEATS = 3
+
+
+def parse_time(structure_file_path: str) -> float:
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        if structure_file_path.endswith(".bcif"):
+            structure_file = pdbx.BinaryCIFFile.read(structure_file_path)
+        else:
+            structure_file = pdbx.CIFFile.read(structure_file_path)
+        protein = pdbx.get_structure(structure_file, model=1)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+fixture_directory = sys.argv[1]
+entries = sorted(
+    os.path.splitext(f)[0]
+    for f in os.listdir(fixture_directory)
+    if f.endswith(".bcif") and os.path.exists(os.path.join(fixture_directory, f"{os.path.splitext(f)[0]}.cif"))
+)
+
+total_cif_size = total_bcif_size = 0
+total_cif_time = total_bcif_time = 0.0
+
+for entry in entries:
+    cif_path = os.path.join(fixture_directory, f"{entry}.cif")
+    bcif_path = os.path.join(fixture_directory, f"{entry}.bcif")
+
+    cif_size, bcif_size = os.path.getsize(cif_path), os.path.getsize(bcif_path)
+    cif_time, bcif_time = parse_time(cif_path), parse_time(bcif_path)
+
+    total_cif_size += cif_size
+    total_bcif_size += bcif_size
+    total_cif_time += cif_time
+    total_bcif_time += bcif_time
+
+    print(
+        f"{entry}: cif {cif_size / 1024**2:.1f} MB in {cif_time * 1000:.0f} ms, "
+        f"bcif {bcif_size / 1024**2:.1f} MB in {bcif_time * 1000:.0f} ms "
+        f"({cif_size / bcif_size:.1f}x smaller, {cif_time / bcif_time:.1f}x faster)"
+    )
+
+if entries:
+    print(
+        f"{len(entries)} entries: {total_cif_size / total_bcif_size:.1f}x fewer bytes, "
+        f"{total_cif_time / total_bcif_time:.1f}x faster parsing with BinaryCIF"
+    )
+else:
+    print(f"No <id>.bcif + <id>.cif pairs found in {fixture_directory}")
@@ -0,0 +1,230 @@
+import os
+
+import numpy as np
+import biotite.structure.io.pdbx as pdbx
+import biotite.structure.io.pdb as pdb
+from biotite.structure import AtomArray
+from biotite.sequence import ProteinSequence
+
+RESIDUE_TABLE_FILE = "residues.npz"
+PDB_HEADER_RECORDS = ("HEADER", "TITLE", "COMPND", "SOURCE")
+# kept in the saved first model (the B-factor column holds the pLDDT of AlphaFold models)
+EXTRA_FIELDS = ["b_factor", "occupancy"]
+
+
+def build_residue_table(protein: AtomArray) -> dict[str, np.ndarray]:
+    """
+    Build the residue table (one row per CA atom) of a structure.
+
+    Args:
+        protein (AtomArray): The first model of the structure (all atoms).
+
+    Returns:
+        dict[str, np.ndarray]: Columns "coord" (float32, shape: (N, 3)), "chain_id", "res_id", "res_name"
+            and "sequence" (one-letter code of each residue, "X" for unknown residues).
+    """
+    ca_atoms: AtomArray = protein[(protein.atom_name == "CA") & (protein.element == "C")]  # type: ignore
+
+    # map every distinct residue name once, then gather the one-letter codes for all residues
+    res_names, inverse = np.unique(ca_atoms.res_name.astype(str), return_inverse=True)
+    one_letter = np.array(
+        [
+            ProteinSequence.convert_letter_3to1(res_name) if res_name in ProteinSequence._dict_3to1 else "X"
+            for res_name in res_names.tolist()
+        ],
+        dtype="<U1",
+    )
+
+    return {
+        "coord": ca_atoms.coord.astype(np.float32),
+        "chain_id": ca_atoms.chain_id.astype(str),
+        "res_id": ca_atoms.res_id.astype(np.int64),
+        "res_name": ca_atoms.res_name.astype(str),
+        "sequence": one_letter[inverse.reshape(-1)],
+    }
+
+
+def save_residue_table(residue_table: dict[str, np.ndarray], job_path: str) -> None:
+    """
+    Store the residue table in the job directory.
+
+    Args:
+        residue_table (dict[str, np.ndarray]): The table from `build_residue_table`.
+        job_path (str): Path to the job directory.
+    """
+    np.savez(os.path.join(job_path, RESIDUE_TABLE_FILE), **residue_table)
+
+
+def load_residue_table(job_path: str) -> dict[str, np.ndarray] | None:
+    """
+    Load the residue table stored in the job directory.
+
+    Args:
+        job_path (str): Path to the job directory.
+
+    Returns:
+        dict[str, np.ndarray] | None: The table, or None if the job has no table.
+    """
+    path = os.path.join(job_path, RESIDUE_TABLE_FILE)
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def get_chain_order(residue_table: dict[str, np.ndarray]) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """
+    Get the order of the residues grouped chain by chain (the chains in the order of their first residue,
+    the residues of a chain in the table order).
+
+    Args:
+        residue_table (dict[str, np.ndarray]): The residue table.
+
+    Returns:
+        tuple: A tuple containing:
+            - chains (list[str]): The chain identifiers.
+            - order (np.ndarray): Indices of the residues in the table, chain by chain.
+            - offsets (np.ndarray): Start of each chain in `order` (shape: (len(chains) + 1,)).
+    """
+    chain_ids, first_residue, inverse = np.unique(residue_table["chain_id"], return_index=True, return_inverse=True)
+    chain_rank = np.empty(len(chain_ids), dtype=np.int64)
+    chain_rank[np.argsort(first_residue, kind="stable")] = np.arange(len(chain_ids))
+
+    residue_chain_rank = chain_rank[inverse.reshape(-1)]
+    order = np.argsort(residue_chain_rank, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(residue_chain_rank, minlength=len(chain_ids)))))
+
+    return chain_ids[np.argsort(first_residue, kind="stable")].tolist(), order, offsets
+
+
+def get_sequences_by_chain(residue_table: dict[str, np.ndarray]) -> dict[str, str]:
+    """
+    Get the sequence of every chain (in the order of the first residue of each chain).
+
+    Args:
+        residue_table (dict[str, np.ndarray]): The residue table.
+
+    Returns:
+        dict[str, str]: Dictionary mapping chain identifiers to their sequences.
+    """
+    chains, order, offsets = get_chain_order(residue_table)
+    sequence = "".join(residue_table["sequence"][order].tolist())
+
+    return {chain: sequence[offsets[i] : offsets[i + 1]] for i, chain in enumerate(chains)}
+
+
+def get_residue_ids(residue_table: dict[str, np.ndarray]) -> list[str]:
+    """
+    Get the identifiers of the residues in the format "{chain}_{res_id}".
+
+    Args:
+        residue_table (dict[str, np.ndarray]): The residue table.
+
+    Returns:
+        list[str]: The identifier of each residue.
+    """
+    return [
+        f"{chain_id}_{res_id}"
+        for chain_id, res_id in zip(residue_table["chain_id"].tolist(), residue_table["res_id"].tolist())
+    ]
+
+
+def _read_pdbx_file(structure_file_path: str) -> pdbx.CIFFile | pdbx.BinaryCIFFile:
+    if structure_file_path.lower().endswith(".bcif"):
+        return pdbx.BinaryCIFFile.read(structure_file_path)
+
+    return pdbx.CIFFile.read(structure_file_path)
+
+
+def read_structure(structure_file_path: str) -> AtomArray:
+    """
+    Read the first model of a structure file.
+
+    Args:
+        structure_file_path (str): Path to the structure file (PDB, CIF or BinaryCIF format).
+
+    Returns:
+        AtomArray: The first model of the structure.
+
+    Raises:
+        ValueError: If the file format is unsupported.
+    """
+    if structure_file_path.lower().endswith((".cif", ".bcif")):
+        return pdbx.get_structure(_read_pdbx_file(structure_file_path), model=1)  # type: ignore
+
+    if structure_file_path.lower().endswith((".pdb", ".pdb1")):
+        return pdb.get_structure(pdb.PDBFile.read(structure_file_path), model=1)  # type: ignore
+
+    raise ValueError("Unsupported file format")
+
+
+def ingest_structure(
+    structure_path_original: str, job_path: str, write_pdb_copy: bool = True
+) -> tuple[str, dict[str, np.ndarray]]:
+    """
+    Parse the uploaded or downloaded structure once and write everything the later stages need
+    to the job directory: the first model with the original header (`structure.cif` / `structure.pdb`),
+    the residue table (`residues.npz`) and, for (Binary)CIF input, a PDB copy for the trajectory generation.
+
+    Args:
+        structure_path_original (str): Path to the input structure file (PDB, CIF or BinaryCIF format).
+        job_path (str): Path to the job directory.
+        write_pdb_copy (bool): Write the PDB copy of an mmCIF structure (skipped if the structure
+            does not fit the PDB format).
+
+    Returns:
+        tuple: A tuple containing:
+            - structure_file_path (str): Path to the saved first model.
+            - residue_table (dict[str, np.ndarray]): The residue table.
+
+    Raises:
+        ValueError: If the input file format is unsupported.
+    """
+    if structure_path_original.lower().endswith((".cif", ".bcif")):
+        # BinaryCIF is decoded directly, the saved first model is always plain-text mmCIF
+        structure_file_path = os.path.join(job_path, "structure.cif")
+
+        original_file = _read_pdbx_file(structure_path_original)
+        protein: AtomArray = pdbx.get_structure(original_file, model=1, extra_fields=EXTRA_FIELDS)  # type: ignore
+
+        # Keep just the first model in the file, with the entry ID of the original file
+        structure_file = pdbx.CIFFile()
+        pdbx.set_structure(structure_file, protein, data_block="protein")
+        if "entry" in original_file.block:
+            structure_file.block["entry"] = pdbx.CIFCategory(
+                {name: column.as_array() for name, column in original_file.block["entry"].items()}
+            )
+        structure_file.write(structure_file_path)
+
+        if write_pdb_copy:
+            try:
+                pdb_file = pdb.PDBFile()
+                pdb.set_structure(pdb_file, protein)
+                pdb_file.write(os.path.join(job_path, "structure.pdb"))
+            except Exception as e:
+                # e.g. multi-character chain IDs, the trajectory generation converts the mmCIF file itself
+                print(f"Could not write the PDB copy of {structure_file_path}: {e}")
+
+    elif structure_path_original.lower().endswith((".pdb", ".pdb1")):
+        structure_file_path = os.path.join(job_path, "structure.pdb")
+
+        original_file = pdb.PDBFile.read(structure_path_original)
+        protein: AtomArray = pdb.get_structure(original_file, model=1, extra_fields=EXTRA_FIELDS)  # type: ignore
+
+        # Keep just the first model in the file, with the header records of the original file
+        header_lines = [line for line in original_file.lines if line.startswith(PDB_HEADER_RECORDS)]
+
+        structure_file = pdb.PDBFile()
+        pdb.set_structure(structure_file, protein)
+        with open(structure_file_path, "w") as f:
+            f.writelines(f"{line}\n" for line in header_lines)
+            structure_file.write(f)
+
+    else:
+        raise ValueError("Unsupported file format")
+
+    residue_table = build_residue_table(protein)
+    save_residue_table(residue_table, job_path)
+
+    return structure_file_path, residue_table
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Path, Body
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Path, Body, Query
 from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.logger import logger
 from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from prometheus_fastapi_instrumentator import Instrumentator
 from models import (
     CalculateRequest,
     CalculateResponse,
+    ReclusterRequest,
+    ReclusterResponse,
     TaskStatusResponse,
     FileResponseModel,
     ProxyRequest,
@@ -14,18 +17,46 @@ from models import (
 )
 
 import httpx
+import hashlib
 import json
 import asyncio
 import logging
 import os
 import shutil
 
+from contextlib import asynccontextmanager
+from typing import BinaryIO
+
 from .tasks import celery_app
-from .utils import get_existing_result, generate_random_folder_name, download_cif_file
+from .utils import (
+    get_file_hash,
+    get_existing_result_by_hash,
+    get_recluster_results_filename,
+    round_clustering_parameters,
+    generate_random_folder_name,
+    is_error_page,
+)
 from .commons import JOBS_BASE_PATH
+from .structure_download import StructureDownloader, create_download_client
+from .structure_index import StructureIndex, is_valid_structure_id, normalize_structure_id
+from .clustering import load_cluster_graph, cluster_with_graph, group_pockets, MAX_EPS
 from celery.result import AsyncResult
 
-app = FastAPI(openapi_url="/api/openapi", root_path="/api", servers=[{"url": "/api"}])
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(20 * 1024**2)))  # 20 MB, the nginx client_max_body_size
+UPLOAD_CHUNK_SIZE = 1024**2  # 1 MB
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared HTTP client for the structure downloads (closed on shutdown) and open the structure index."""
+    app.state.structure_index = StructureIndex()
+
+    async with create_download_client() as client:
+        app.state.structure_downloader = StructureDownloader(client)
+        yield
+
+
+app = FastAPI(openapi_url="/api/openapi", root_path="/api", servers=[{"url": "/api"}], lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -86,6 +117,14 @@ async def gpu_status():
     return {"task_id": task.id}
 
 
+@app.get("/model-status", response_model=CalculateResponse)
+async def model_status():
+    """Check the memory footprint of the model resident in a worker."""
+    task: AsyncResult = celery_app.send_task("celery_app.model_status")
+
+    return {"task_id": task.id}
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health():
     """Check if the server is healthy."""
@@ -106,22 +145,39 @@ async def calculate(
     if "pdb" not in request.model_dump():
         return JSONResponse(status_code=400, content={"error": "Missing 'pdb' field in request."})
 
-    pdb_id = request.pdb
+    # malformed IDs are neither downloaded nor stored in the index
+    if not is_valid_structure_id(request.pdb):
+        return JSONResponse(status_code=400, content={"error": "Invalid PDB / UniProt ID."})
+
+    # the same ID is looked up, downloaded (AlphaFold DB URLs are case-sensitive) and stored in the index
+    pdb_id = normalize_structure_id(request.pdb)
+    structure_index: StructureIndex = app.state.structure_index
+
+    # Known structures and known invalid IDs are answered from the index, without a download.
+    indexed_hash = await run_in_threadpool(structure_index.lookup, pdb_id)
+    if indexed_hash == "":
+        return JSONResponse(status_code=400, content={"error": "PDB ID not found."})
+
+    if indexed_hash:
+        result = await run_in_threadpool(get_existing_result_by_hash, indexed_hash)
+        if result:
+            return result
 
     tmp_dir = os.path.join(JOBS_BASE_PATH, generate_random_folder_name())
     os.makedirs(tmp_dir, exist_ok=True)
 
     try:
-        cif_file_path: str = download_cif_file(pdb_id, tmp_dir)  # type: ignore
+        cif_file_path: str = await app.state.structure_downloader.download(pdb_id, tmp_dir)
         if not cif_file_path:
+            shutil.rmtree(tmp_dir)
+            await run_in_threadpool(structure_index.record, pdb_id, "")
             return JSONResponse(status_code=400, content={"error": "PDB ID not found."})
 
         # Here, we check if the file is actually a CIF file, and not an error message - wrong PDB ID might return a HTML file.
-        with open(cif_file_path, "r") as f:
-            cif_file_content = f
-            if "400 Bad Request" in cif_file_content.read() or "404 Not Found" in cif_file_content.read():
-                shutil.rmtree(tmp_dir)
-                return JSONResponse(status_code=400, content={"error": "PDB ID not found."})
+        if is_error_page(cif_file_path):
+            shutil.rmtree(tmp_dir)
+            await run_in_threadpool(structure_index.record, pdb_id, "")
+            return JSONResponse(status_code=400, content={"error": "PDB ID not found."})
 
     except Exception as e:
         shutil.rmtree(tmp_dir)
@@ -130,9 +186,12 @@ async def calculate(
             content={"error": "Could not load the structure from the PDB ID. Perhaps it does not exist?"},
         )
 
-    result = get_existing_result(cif_file_path)
+    file_hash = (await run_in_threadpool(get_file_hash, cif_file_path))["md5"]
+    await run_in_threadpool(structure_index.record, pdb_id, file_hash)
+
+    result = await run_in_threadpool(get_existing_result_by_hash, file_hash)
     if result:
-        shutil.rmtree(tmp_dir)
+        await run_in_threadpool(shutil.rmtree, tmp_dir)
         return result
 
     task: AsyncResult = celery_app.send_task(
@@ -146,8 +205,44 @@ async def calculate(
     return {"task_id": task.id}
 
 
+def hash_upload(upload_file: BinaryIO) -> str | None:
+    """Compute the MD5 hash of an uploaded file in chunks (blocking, call it from the thread pool).
+    Starlette has already spooled the body, so nothing is written to the job directory for a cache hit.
+
+    Args:
+        upload_file (BinaryIO): The spooled file of the upload (`UploadFile.file`).
+
+    Returns:
+        str | None: The MD5 hex digest of the file, or None if the file is larger than MAX_UPLOAD_SIZE.
+    """
+    md5 = hashlib.md5()
+    size = 0
+
+    upload_file.seek(0)
+    while chunk := upload_file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_SIZE:
+            return None
+
+        md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def save_upload(upload_file: BinaryIO, file_path: str) -> None:
+    """Copy an uploaded file to the job directory in chunks (blocking, call it from the thread pool).
+
+    Args:
+        upload_file (BinaryIO): The spooled file of the upload (`UploadFile.file`).
+        file_path (str): Path where the file will be saved.
+    """
+    upload_file.seek(0)
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(upload_file, f, UPLOAD_CHUNK_SIZE)
+
+
 @app.post("/calculate-custom", response_model=CalculateResponse)
-async def calculate_custom(file: UploadFile = File(..., description="PDB/CIF file to be processed")):
+async def calculate_custom(file: UploadFile = File(..., description="PDB/CIF/BinaryCIF file to be processed")):
     """Upload a PDB/CIF file and calculate the prediction.
 
     Args:
@@ -157,22 +252,29 @@ async def calculate_custom(file: UploadFile = File(..., description="PDB/CIF fil
     if not file or not file.filename:
         return JSONResponse(status_code=400, content={"error": "No file uploaded."})
 
-    if not file.filename.lower().endswith((".pdb", ".cif", ".pdb1")):
-        return JSONResponse(status_code=400, content={"error": "Only .pdb, .pdb1 and .cif files are supported."})
-
-    tmp_dir = os.path.join(JOBS_BASE_PATH, generate_random_folder_name())
-    os.makedirs(tmp_dir, exist_ok=True)
+    if not file.filename.lower().endswith((".pdb", ".cif", ".bcif", ".pdb1")):
+        return JSONResponse(
+            status_code=400, content={"error": "Only .pdb, .pdb1, .cif and .bcif files are supported."}
+        )
 
-    file_path = os.path.join(tmp_dir, file.filename)
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        return JSONResponse(status_code=413, content={"error": "The uploaded file is too large."})
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    file_hash = await run_in_threadpool(hash_upload, file.file)
+    if file_hash is None:
+        return JSONResponse(status_code=413, content={"error": "The uploaded file is too large."})
 
-    result = get_existing_result(file_path)
+    # a cache hit returns before anything is written to the jobs directory
+    result = await run_in_threadpool(get_existing_result_by_hash, file_hash)
     if result:
-        shutil.rmtree(tmp_dir)
         return result
 
+    tmp_dir = os.path.join(JOBS_BASE_PATH, generate_random_folder_name())
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    file_path = os.path.join(tmp_dir, os.path.basename(file.filename))
+    await run_in_threadpool(save_upload, file.file, file_path)
+
     task: AsyncResult = celery_app.send_task(
         "celery_app.process_esm2_cryptobench",
         args=(
@@ -184,8 +286,132 @@ async def calculate_custom(file: UploadFile = File(..., description="PDB/CIF fil
     return {"task_id": task.id}
 
 
+@app.post("/recluster/{task_hash}", response_model=ReclusterResponse, response_model_exclude_none=True)
+async def recluster(
+    task_hash: str = Path(
+        ..., example="123e4567-e89b-12d3-a456-123123123000", description="The hash of the finished task"
+    ),
+    request: ReclusterRequest = Body(
+        ..., example={"score_threshold": 0.7, "eps": 5.0, "min_samples": 3}, description="Clustering parameters"
+    ),
+):
+    """Re-cluster the residues of a finished task with different parameters (the prediction is not rerun).
+    Already computed results are returned directly ({"status", "result"}),
+    otherwise a Celery task is started ({"task_id"}).
+
+    Args:
+        task_hash (str): The hash of the finished task.
+        request (ReclusterRequest): The request body containing the clustering parameters.
+    """
+    if ".." in task_hash:
+        return JSONResponse(status_code=403, content={"error": "Nice try, but no."})
+
+    if not os.path.exists(os.path.join(JOBS_BASE_PATH, task_hash, "results.json")):
+        return JSONResponse(status_code=404, content={"error": "Task not found."})
+
+    # the task clusters with the rounded parameters, so the results file matches its name
+    score_threshold, eps = round_clustering_parameters(request.score_threshold, request.eps)
+    RESULTS_FILE = os.path.join(
+        JOBS_BASE_PATH,
+        task_hash,
+        get_recluster_results_filename(score_threshold, eps, request.min_samples),
+    )
+
+    if os.path.exists(RESULTS_FILE):
+        return {"status": "SUCCESS", "result": await run_in_threadpool(load_json, RESULTS_FILE)}
+
+    task: AsyncResult = celery_app.send_task(
+        "celery_app.recluster",
+        args=(task_hash, score_threshold, eps, request.min_samples),
+    )
+
+    return {"task_id": task.id}
+
+
+@app.get("/clusters/{task_hash}", response_model=dict)
+def get_clusters(
+    task_hash: str = Path(
+        ..., example="123e4567-e89b-12d3-a456-123123123000", description="The hash of the finished task"
+    ),
+    score_threshold: float = Query(
+        0.7, ge=0.0, le=1.0, description="Only the residues with a higher score are clustered"
+    ),
+    eps: float = Query(5.0, gt=0.0, le=MAX_EPS, description="Max distance of two neighboring residues"),
+    min_samples: int = Query(3, ge=1, le=100, description="Min number of neighbors of a core residue"),
+):
+    """Get the pocket assignments of a finished task for the given clustering parameters.
+    The clustering runs on the radius graph precomputed by the task (without the refinement), so it is instant.
+
+    Args:
+        task_hash (str): The hash of the finished task.
+        score_threshold (float): Only the residues with a higher score are clustered.
+        eps (float): Max distance of two neighboring residues.
+        min_samples (int): Min number of neighbors of a core residue.
+    """
+    if ".." in task_hash:
+        return JSONResponse(status_code=403, content={"error": "Nice try, but no."})
+
+    graph = load_cluster_graph(os.path.join(JOBS_BASE_PATH, task_hash))
+    if graph is None:
+        return JSONResponse(status_code=404, content={"error": "Cluster graph not found."})
+
+    clusters = cluster_with_graph(graph, score_threshold, eps, min_samples)
+    clusters, pockets = group_pockets(
+        [int(c) for c in clusters], graph["prediction_scores"].tolist(), graph["residue_ids"].tolist(), graph["points"]
+    )
+
+    return {"clusters": clusters, "pockets": pockets}
+
+
+async def index_structure(structure_id: str) -> str:
+    """Download a structure to a temporary directory, store the MD5 hash of the file in the structure index
+    and remove the directory.
+
+    Args:
+        structure_id (str): A normalized (see `normalize_structure_id`) 4-character PDB ID or UniProt ID.
+
+    Returns:
+        str: The MD5 hex digest, or an empty string ("") if the structure does not exist.
+    """
+    tmp_dir = os.path.join(JOBS_BASE_PATH, generate_random_folder_name())
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    try:
+        cif_file_path = await app.state.structure_downloader.download(structure_id, tmp_dir)
+        if cif_file_path and not is_error_page(cif_file_path):
+            file_hash = (await run_in_threadpool(get_file_hash, cif_file_path))["md5"]
+        else:
+            file_hash = ""
+    finally:
+        await run_in_threadpool(shutil.rmtree, tmp_dir, True)
+
+    await run_in_threadpool(app.state.structure_index.record, structure_id, file_hash)
+    return file_hash
+
+
+def get_celery_task_status(task_id: str) -> dict:
+    """Get the state and the result of a Celery task (blocking, it queries the result backend).
+
+    Args:
+        task_id (str): The task ID to check the status for.
+    """
+    task_result: AsyncResult = celery_app.AsyncResult(task_id)
+
+    # Serialize exceptions to string, the result of the response must be a dict
+    result_value = task_result.result
+    if isinstance(result_value, Exception):
+        return {"status": task_result.state, "result": None, "error": str(result_value)}
+
+    return {"status": task_result.state, "result": result_value, "error": None}
+
+
+def load_json(file_path: str) -> dict:
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
 @app.get("/task-status/{task_id}", response_model=TaskStatusResponse)
-def get_status(
+async def get_status(
     task_id: str = Path(..., example="123e4567-e89b-12d3-a456-123123123000", description="The ID of the task to check")
 ):
     """
@@ -199,26 +425,23 @@ def get_status(
     RESULTS_FILE = os.path.join(JOBS_BASE_PATH, task_id, "results.json")
 
     if os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, "r") as f:
-            return {"status": "SUCCESS", "result": json.load(f)}
+        return {"status": "SUCCESS", "result": await run_in_threadpool(load_json, RESULTS_FILE)}
 
-    elif len(task_id) < 8:
-        # Consider this to be a PDB/AF id.
+    elif len(task_id) < 8 and is_valid_structure_id(task_id):
+        # Consider this to be a PDB/AF id, the structure is downloaded only if the ID is not indexed yet.
+        structure_id = normalize_structure_id(task_id)
         try:
-            result = get_existing_result(download_cif_file(task_id))
+            file_hash = await run_in_threadpool(app.state.structure_index.lookup, structure_id)
+            if file_hash is None:
+                file_hash = await index_structure(structure_id)
+
+            result = await run_in_threadpool(get_existing_result_by_hash, file_hash) if file_hash else None
             if result:
                 return {"status": "SUCCESS", "result": result}
         except Exception as e:
-            return {"status: 'FAILURE', result": f"Failed to find the task result: {str(e)}"}
+            return {"status": "FAILURE", "result": None, "error": f"Failed to find the task result: {str(e)}"}
 
-    task_result: AsyncResult = celery_app.AsyncResult(task_id)
-
-    # Serialize exceptions to string
-    result_value = task_result.result
-    if isinstance(result_value, Exception):
-        result_value = str(result_value)
-
-    return {"status": task_result.state, "result": result_value, "error": None}
+    return await run_in_threadpool(get_celery_task_status, task_id)
 
 
 @app.get("/file/{task_hash}/{filename}", response_model=FileResponseModel)
@@ -9,6 +9,27 @@ class CalculateRequest(BaseModel):
         json_schema_extra = {"example": {"pdb": "2SRC"}}
 
 
+class ReclusterRequest(BaseModel):
+    score_threshold: float = Field(
+        0.7,
+        ge=0.0,
+        le=1.0,
+        examples=[0.7],
+        description="Only the residues with a higher score are clustered (rounded to 3 decimals).",
+    )
+    eps: float = Field(
+        5.0,
+        gt=0.0,
+        le=50.0,
+        examples=[5.0],
+        description="Max distance of two neighboring residues (rounded to 2 decimals, at least 0.01).",
+    )
+    min_samples: int = Field(3, ge=1, le=100, examples=[3], description="Min number of neighbors of a core residue.")
+
+    class Config:
+        json_schema_extra = {"example": {"score_threshold": 0.7, "eps": 5.0, "min_samples": 3}}
+
+
 class CalculateResponse(BaseModel):
     task_id: str = Field(
         ...,
@@ -20,9 +41,25 @@ class CalculateResponse(BaseModel):
         json_schema_extra = {"example": {"task_id": "123e4567-e89b-12d3-a456-123123123000"}}
 
 
+class ReclusterResponse(BaseModel):
+    task_id: Optional[str] = Field(
+        None,
+        examples=["123e4567-e89b-12d3-a456-123123123000"],
+        description="Identifier of the started re-clustering task (if the results were not computed yet).",
+    )
+    status: Optional[str] = Field(
+        None, examples=["SUCCESS"], description="SUCCESS if the results were computed already."
+    )
+    result: Optional[dict] = Field(None, examples=[{"key": "value"}], description="The already computed results.")
+
+    class Config:
+        json_schema_extra = {"example": {"task_id": "123e4567-e89b-12d3-a456-123123123000"}}
+
+
 class TaskStatusResponse(BaseModel):
     status: str = Field(..., examples=["SUCCESS"], description="Current status of the task.")
     result: Optional[dict] = Field(None, examples=[{"key": "value"}], description="Result data when task is complete.")
+    error: Optional[str] = Field(None, examples=["Task failed."], description="Error message when the task failed.")
 
     class Config:
         json_schema_extra = {"example": {"status": "SUCCESS", "result": {"key": "value"}}}
@@ -1 +1,4 @@
-from .compute_score import compute_prediction
+from .compute_score import compute_predictions
+from .model_registry import load_models, warmup, get_model_memory_footprint
+from .inference_server import INFERENCE_SERVER_ADDRESS
+from .embedding_store import EmbeddingStore
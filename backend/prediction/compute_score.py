@@ -1,95 +1,204 @@
 import torch
-from transformers import AutoTokenizer, EsmModel
 import numpy as np
-import torch.nn as nn
 import os
 
-ESM_MODEL_NAME = "facebook/esm2_t33_650M_UR50D"
-MAX_LENGTH = 1024
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-OUTPUT_SIZE = 1
-DROPOUT = 0.25
-SEQUENCE_MAX_LENGTH = MAX_LENGTH - 2
-MODEL_PATH = "/app/cryptobench-small/model-650M-finetuned.pt"
+from typing import Callable
 
+from .esm_model import FinetuneESM, MAX_LENGTH, DEVICE, SEQUENCE_MAX_LENGTH
+from .onnx_backend import OnnxFinetuneESM
+from .model_registry import get_model, get_tokenizer, inference_context, INFERENCE_PRECISION
+from .inference_server import INFERENCE_SERVER_ADDRESS, predict_chunks_remote, get_remote_settings
+from .sequence_cache import get_cached_prediction, cache_prediction
+from .embedding_store import EmbeddingStore
 
-class FinetuneESM(nn.Module):
-    def __init__(self, esm_model: str) -> None:
-        super().__init__()
-        self.llm = EsmModel.from_pretrained(esm_model)
-        self.dropout = nn.Dropout(DROPOUT)
-        self.classifier = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
-        self.plDDT_regressor = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
-        self.distance_regressor = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
+# "longest" pads every batch only to its longest sequence, "max_length" pads everything to MAX_LENGTH (legacy behavior)
+PADDING_MODE = os.getenv("CRYPTOBENCH_PADDING", "longest")
+BATCH_SIZE = int(os.getenv("CRYPTOBENCH_BATCH_SIZE", "8"))
+BUCKET_WIDTH = 128  # chunks whose lengths fall into the same window of this many residues are batched together
 
-    def forward(self, batch: dict[str, np.ndarray]) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-        input_ids, attention_mask = batch["input_ids"], batch["attention_mask"]
-        token_embeddings = self.llm(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
 
-        return (
-            self.classifier(token_embeddings),
-            self.plDDT_regressor(token_embeddings),
-            self.distance_regressor(token_embeddings),
-        )
+def split_into_chunks(sequence: str) -> list[str]:
+    """
+    Split a sequence into chunks that fit into the ESM-2 context window.
+
+    Args:
+        sequence (str): Sequence of amino acids.
+
+    Returns:
+        list[str]: Consecutive chunks of at most SEQUENCE_MAX_LENGTH residues.
+    """
+    return [sequence[i : i + SEQUENCE_MAX_LENGTH] for i in range(0, len(sequence), SEQUENCE_MAX_LENGTH)]
 
 
-def compute_prediction(sequence: str, job_path: str, chain: str) -> np.ndarray:
+def make_batches(chunks: list[str], batch_size: int = BATCH_SIZE) -> list[list[int]]:
     """
-    Compute the residue-level prediction using the CryptoBench model.
-    Also saves the embeddings for the sequence in the specified job path - this is needed for cluster refinement.
+    Group chunks into batches of similar lengths, so that padding to the longest chunk wastes little compute.
 
     Args:
-        sequence (str): Sequence of amino acids to be predicted.
-        job_path (str): Path to the job directory where results will be saved.
-        chain (str): Chain identifier for the sequence.
+        chunks (list[str]): The chunks to be batched.
+        batch_size (int): Maximum number of chunks in a single batch.
 
     Returns:
-        np.ndarray: The predicted scores for each residue.
+        list[list[int]]: Batches of indices into `chunks`.
     """
-    model = FinetuneESM(ESM_MODEL_NAME).to(DEVICE)
-    model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE), strict=True)
+    buckets: dict[int, list[int]] = {}
+    for idx in sorted(range(len(chunks)), key=lambda i: len(chunks[i])):
+        buckets.setdefault(len(chunks[idx]) // BUCKET_WIDTH, []).append(idx)
+
+    batches = []
+    for bucket in buckets.values():
+        for i in range(0, len(bucket), batch_size):
+            batches.append(bucket[i : i + batch_size])
+
+    return batches
+
+
+def predict_chunks(
+    chunks: list[str],
+    padding: str = PADDING_MODE,
+    batch_size: int = BATCH_SIZE,
+    on_batch_done: Callable[[list[int]], None] | None = None,
+    model: FinetuneESM | OnnxFinetuneESM | None = None,
+    precision: str = INFERENCE_PRECISION,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Run the CryptoBench model on a list of chunks, batched by length.
 
-    tokenizer = AutoTokenizer.from_pretrained(ESM_MODEL_NAME)
-    model.eval()
+    Args:
+        chunks (list[str]): Chunks of at most SEQUENCE_MAX_LENGTH residues.
+        padding (str): Either "longest" (pad to the longest chunk in a batch) or "max_length" (pad to MAX_LENGTH).
+        batch_size (int): Maximum number of chunks in a single forward pass.
+        on_batch_done (Callable[[list[int]], None] | None): Called with the chunk indices of every finished batch.
+        model (FinetuneESM | OnnxFinetuneESM | None): The model to use, defaults to the resident model.
+        precision (str): Inference precision of the model (see `model_registry.PRECISIONS`).
 
-    KRAS_sequence = str(sequence)
-    all_embeddings = []
-    final_output = []
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: For every chunk (in the input order) a tuple of
+            the predicted scores (shape: (len(chunk),)) and the embeddings (shape: (len(chunk), hidden_dim)).
+    """
+    if model is None:
+        model = get_model()
+    tokenizer = get_tokenizer()
 
-    # Process sequence in chunks of SEQUENCE_MAX_LENGTH
-    for i in range(0, len(KRAS_sequence), SEQUENCE_MAX_LENGTH):
-        processed_sequence = KRAS_sequence[i : i + SEQUENCE_MAX_LENGTH]
+    results: list[tuple[np.ndarray, np.ndarray]] = [None] * len(chunks)  # type: ignore
 
+    for batch in make_batches(chunks, batch_size):
         tokenized = tokenizer(
-            processed_sequence, max_length=MAX_LENGTH, padding="max_length", truncation=True, return_tensors="pt"
-        )
+            [chunks[idx] for idx in batch],
+            max_length=MAX_LENGTH,
+            padding=padding,
+            truncation=True,
+            return_tensors="pt",
+        )  # type: ignore
         tokenized = {k: v.to(DEVICE) for k, v in tokenized.items()}
 
-        # embeddings
-        with torch.no_grad():
-            llm_output = model.llm(input_ids=tokenized["input_ids"], attention_mask=tokenized["attention_mask"])
-            embeddings = llm_output.last_hidden_state  # shape: (1, seq_len, hidden_dim)
+        # a single transformer pass yields both the embeddings and the classifier output
+        with torch.no_grad(), inference_context(precision):
+            output, _, _, embeddings = model.forward_with_embeddings(tokenized)  # type: ignore
+
+        # the outputs might be in reduced precision, numpy does not support bfloat16
+        probabilities = torch.sigmoid(output.float()).squeeze(-1)
+        embeddings = embeddings.float()
+        masks = tokenized["attention_mask"].bool()
+
+        for row, idx in enumerate(batch):
+            mask = masks[row]
+            # exclude [CLS], [SEP] and the padding
+            results[idx] = (
+                probabilities[row][mask][1:-1].detach().cpu().numpy(),
+                embeddings[row][mask][1:-1].detach().cpu().numpy(),
+            )
 
-        embeddings_np = embeddings.squeeze(0).detach().cpu().numpy()
-        mask = tokenized["attention_mask"].squeeze(0).detach().cpu().numpy().astype(bool)
-        embeddings_np = embeddings_np[mask][1:-1]  # exclude [CLS], [SEP]
-        all_embeddings.append(embeddings_np)
+        if on_batch_done:
+            on_batch_done(batch)
 
-        # prediction
-        with torch.no_grad():
-            output, _, _ = model(tokenized)
+    return results
 
-        output = output.squeeze(0)
-        mask = tokenized["attention_mask"].squeeze(0).bool()
-        output = output[mask][1:-1]  # exclude [CLS], [SEP]
 
-        probabilities = torch.sigmoid(output).detach().cpu().numpy()
-        final_output.extend(probabilities)
+def compute_predictions(
+    sequences_by_chain: dict[str, str],
+    embedding_store: EmbeddingStore,
+    on_chain_done: Callable[[str, int, int], None] | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Compute the residue-level prediction for all chains of a structure at once.
+    Identical chains are predicted only once and sequences already present in the sequence cache are not predicted
+    at all. The chunks of the remaining sequences are batched together, so a structure with many chains needs just
+    a few forward passes. If INFERENCE_SERVER_ADDRESS is set, the chunks are sent to the inference server instead.
+    Also puts the embeddings for every chain into the embedding store - this is needed for cluster refinement.
 
-    # save the concatenated embeddings for the entire sequence
-    final_embeddings = np.concatenate(all_embeddings, axis=0)
-    save_path = os.path.join(job_path, f"embedding_{chain}.npy")
-    print(f"Saving embeddings for chain {chain} in {save_path}")
-    np.save(save_path, final_embeddings)
+    Args:
+        sequences_by_chain (dict[str, str]): Dictionary mapping chain identifiers to their sequences.
+        embedding_store (EmbeddingStore): Job-scoped store the embeddings of every chain are put into.
+        on_chain_done (Callable[[str, int, int], None] | None): Called with the chain identifier,
+            the number of finished chains and the total number of chains whenever a chain is fully predicted.
 
-    return np.array(final_output).flatten()
+    Returns:
+        dict[str, np.ndarray]: The predicted scores for each residue, per chain (in the input order).
+    """
+    chains_by_sequence: dict[str, list[str]] = {}
+    for chain, sequence in sequences_by_chain.items():
+        chains_by_sequence.setdefault(str(sequence), []).append(chain)
+
+    finished_chains = []
+
+    def sequence_done(sequence: str):
+        for chain in chains_by_sequence[sequence]:
+            finished_chains.append(chain)
+            if on_chain_done:
+                on_chain_done(chain, len(finished_chains), len(sequences_by_chain))
+
+    # the cache key depends on the precision and the backend of the process that runs the model
+    settings = get_remote_settings() if INFERENCE_SERVER_ADDRESS else None
+
+    results_by_sequence: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    for sequence in chains_by_sequence:
+        cached = get_cached_prediction(sequence, settings)
+        if cached is not None:
+            print(f"Using cached prediction for chains {', '.join(chains_by_sequence[sequence])}")
+            results_by_sequence[sequence] = cached
+            sequence_done(sequence)
+
+    chunks = []
+    chunk_sequences = []
+    for sequence in chains_by_sequence:
+        if sequence in results_by_sequence:
+            continue
+        for chunk in split_into_chunks(sequence):
+            chunks.append(chunk)
+            chunk_sequences.append(sequence)
+
+    remaining_chunks = {sequence: chunk_sequences.count(sequence) for sequence in set(chunk_sequences)}
+
+    def chunk_progress(batch: list[int]):
+        for idx in batch:
+            sequence = chunk_sequences[idx]
+            remaining_chunks[sequence] -= 1
+            if remaining_chunks[sequence] == 0:
+                sequence_done(sequence)
+
+    if not chunks:
+        chunk_results = []
+    elif INFERENCE_SERVER_ADDRESS:
+        chunk_results = predict_chunks_remote(chunks)
+        settings = get_remote_settings()  # reported with the results
+        chunk_progress(list(range(len(chunks))))
+    else:
+        chunk_results = predict_chunks(chunks, on_batch_done=chunk_progress)
+
+    for sequence in remaining_chunks:
+        sequence_results = [result for result, s in zip(chunk_results, chunk_sequences) if s == sequence]
+        scores = np.concatenate([scores for scores, _ in sequence_results]).flatten()
+        embeddings = np.concatenate([embeddings for _, embeddings in sequence_results], axis=0)
+
+        results_by_sequence[sequence] = (scores, embeddings)
+        cache_prediction(sequence, scores, embeddings, settings)
+
+    predictions = {}
+    for chain, sequence in sequences_by_chain.items():
+        scores, embeddings = results_by_sequence[str(sequence)]
+
+        embedding_store.put(chain, embeddings)
+        predictions[chain] = scores
+
+    return predictions
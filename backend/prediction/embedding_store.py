@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+
+EMBEDDING_STORE_MAX_MEMORY = int(os.getenv("EMBEDDING_STORE_MAX_MEMORY", str(1024**3)))  # 1 GB per job
+JOB_EMBEDDINGS_DIRECTORY = "embeddings"  # the embeddings kept with a finished job for re-clustering
+
+
+class EmbeddingStore:
+    """
+    Job-scoped store of the per-chain embeddings, passed from the prediction to the cluster refinement.
+
+    Embeddings are kept in memory until the job exceeds `max_memory_bytes`, the rest is spilled
+    to memory-mapped float16 files in the job directory (half of the float32 size, read lazily).
+    """
+
+    def __init__(self, job_path: str, max_memory_bytes: int = EMBEDDING_STORE_MAX_MEMORY):
+        self.job_path = job_path
+        self.max_memory_bytes = max_memory_bytes
+        self._memory_bytes = 0
+        self._embeddings: dict[str, np.ndarray] = {}
+        self._spilled_files: list[str] = []
+
+    def put(self, chain: str, embeddings: np.ndarray) -> None:
+        """
+        Store the embeddings of a chain.
+
+        Args:
+            chain (str): Chain identifier.
+            embeddings (np.ndarray): The embeddings for each residue of the chain (shape: (len(sequence), hidden_dim)).
+        """
+        if self._memory_bytes + embeddings.nbytes <= self.max_memory_bytes:
+            self._embeddings[chain] = embeddings
+            self._memory_bytes += embeddings.nbytes
+            return
+
+        spill_path = os.path.join(self.job_path, f"embedding_{chain}.npy")
+        spilled = np.lib.format.open_memmap(spill_path, mode="w+", dtype=np.float16, shape=embeddings.shape)
+        spilled[:] = embeddings
+        spilled.flush()
+        del spilled
+
+        print(f"Spilled embeddings for chain {chain} to {spill_path}")
+        self._spilled_files.append(spill_path)
+        self._embeddings[chain] = np.load(spill_path, mmap_mode="r")
+
+    def get(self, chain: str) -> np.ndarray:
+        """
+        Get the embeddings of a chain.
+
+        Args:
+            chain (str): Chain identifier.
+
+        Returns:
+            np.ndarray: The embeddings (float32 in memory or a read-only float16 memory map).
+
+        Raises:
+            KeyError: If no embeddings were stored for the chain.
+        """
+        if chain not in self._embeddings:
+            raise KeyError(f"Embeddings for chain {chain} not found")
+
+        return self._embeddings[chain]
+
+    def save(self) -> None:
+        """Keep the embeddings of all chains with the job (float16 files in the job directory, not in results.zip),
+        so that re-clustering the job never runs the model again."""
+        directory = os.path.join(self.job_path, JOB_EMBEDDINGS_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+
+        for chain, embeddings in self._embeddings.items():
+            np.save(os.path.join(directory, f"embedding_{chain}.npy"), np.asarray(embeddings, dtype=np.float16))
+
+    @classmethod
+    def load(cls, job_path: str, chains: list[str]) -> "EmbeddingStore | None":
+        """
+        Load the embeddings kept with a finished job (as read-only float16 memory maps).
+
+        Args:
+            job_path (str): Path to the job directory.
+            chains (list[str]): The chains of the job.
+
+        Returns:
+            EmbeddingStore | None: The store, or None if the embeddings of some chain were not kept
+                (e.g. the job predates keeping the embeddings).
+        """
+        directory = os.path.join(job_path, JOB_EMBEDDINGS_DIRECTORY)
+        paths = {chain: os.path.join(directory, f"embedding_{chain}.npy") for chain in chains}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+
+        store = cls(job_path)
+        for chain, path in paths.items():
+            store._embeddings[chain] = np.load(path, mmap_mode="r")  # not spilled, `clear` keeps the files
+
+        return store
+
+    def __contains__(self, chain: str) -> bool:
+        return chain in self._embeddings
+
+    def clear(self) -> None:
+        """Drop all embeddings and remove the spilled files."""
+        self._embeddings.clear()
+        self._memory_bytes = 0
+
+        for spill_path in self._spilled_files:
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+        self._spilled_files.clear()
@@ -0,0 +1,50 @@
+import torch
+from transformers import EsmModel
+import numpy as np
+import torch.nn as nn
+
+ESM_MODEL_NAME = "facebook/esm2_t33_650M_UR50D"
+MAX_LENGTH = 1024
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+OUTPUT_SIZE = 1
+DROPOUT = 0.25
+SEQUENCE_MAX_LENGTH = MAX_LENGTH - 2
+MODEL_PATH = "/app/cryptobench-small/model-650M-finetuned.pt"
+
+
+class FinetuneESM(nn.Module):
+    def __init__(self, esm_model: str) -> None:
+        super().__init__()
+        self.llm = EsmModel.from_pretrained(esm_model)
+        self.dropout = nn.Dropout(DROPOUT)
+        self.classifier = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
+        self.plDDT_regressor = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
+        self.distance_regressor = nn.Linear(self.llm.config.hidden_size, OUTPUT_SIZE)
+
+    def forward(self, batch: dict[str, np.ndarray]) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        classifier_output, plddt_output, distance_output, _ = self.forward_with_embeddings(batch)
+
+        return classifier_output, plddt_output, distance_output
+
+    def forward_with_embeddings(
+        self, batch: dict[str, np.ndarray]
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Run the transformer once and apply all heads to its last hidden state.
+
+        Args:
+            batch (dict[str, np.ndarray]): Tokenized input with "input_ids" and "attention_mask".
+
+        Returns:
+            tuple: Classifier, pLDDT and distance head outputs followed by the token embeddings
+                (last hidden state, shape: (batch, seq_len, hidden_dim)).
+        """
+        input_ids, attention_mask = batch["input_ids"], batch["attention_mask"]
+        token_embeddings = self.llm(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+        return (
+            self.classifier(token_embeddings),
+            self.plDDT_regressor(token_embeddings),
+            self.distance_regressor(token_embeddings),
+            token_embeddings,
+        )
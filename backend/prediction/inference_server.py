@@ -0,0 +1,221 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client
+from typing import Callable
+
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")  # e.g. /app/data/inference.sock
+# required for a "host:port" address, the connections unpickle whatever an authenticated client sends
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "").encode()
+UNIX_SOCKET_AUTHKEY = b"cryptoshow"  # a Unix socket is protected by its file permissions
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "50"))
+
+SETTINGS_REQUEST = "settings"
+
+PredictFn = Callable[[list[str]], list[tuple[np.ndarray, np.ndarray]]]
+
+_remote_settings: dict[str, str] | None = None
+
+
+class MicroBatcher:
+    """
+    Coalesces chunks submitted by many concurrent callers into micro-batches for a single model.
+
+    A batch is dispatched as soon as it holds `max_batch_size` chunks or the oldest request
+    has waited for `max_wait` seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        predict_fn: PredictFn,
+        max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+        max_wait: float = INFERENCE_MAX_WAIT_MS / 1000,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._requests: queue.Queue[tuple[list[str], Future]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, chunks: list[str]) -> Future:
+        """
+        Queue chunks for prediction.
+
+        Args:
+            chunks (list[str]): Chunks of at most SEQUENCE_MAX_LENGTH residues.
+
+        Returns:
+            Future: Resolves to the list of (scores, embeddings) tuples for the submitted chunks.
+        """
+        future: Future = Future()
+        self._requests.put((chunks, future))
+        return future
+
+    def _collect(self) -> list[tuple[list[str], Future]]:
+        pending = [self._requests.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(request)
+            size += len(request[0])
+
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            chunks = [chunk for request_chunks, _ in pending for chunk in request_chunks]
+
+            try:
+                results = self.predict_fn(chunks)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_chunks, future in pending:
+                future.set_result(results[offset : offset + len(request_chunks)])
+                offset += len(request_chunks)
+
+
+def _handle_connection(connection, batcher: MicroBatcher, settings: dict[str, str]):
+    try:
+        with connection:
+            chunks = connection.recv()
+            if chunks == SETTINGS_REQUEST:
+                connection.send({"settings": settings})
+                return
+            try:
+                connection.send({"results": batcher.submit(chunks).result(), "settings": settings})
+            except Exception as e:
+                connection.send({"error": str(e)})
+    except (EOFError, OSError) as e:
+        print(f"Inference server connection failed: {e}")
+
+
+def serve(
+    address: str,
+    predict_fn: PredictFn,
+    max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+    max_wait: float = INFERENCE_MAX_WAIT_MS / 1000,
+    settings: dict[str, str] | None = None,
+):
+    """
+    Serve predictions over a local socket until the process is terminated.
+
+    Args:
+        address (str): Path of the Unix socket (or a "host:port" string, only with INFERENCE_SERVER_AUTHKEY set)
+            to listen on.
+        predict_fn (PredictFn): Function predicting a list of chunks (the real model or a stub).
+        max_batch_size (int): Maximum number of chunks in a micro-batch.
+        max_wait (float): Maximum time in seconds a request waits for other requests to join its batch.
+        settings (dict[str, str] | None): Settings of the served model reported to the clients
+            (the model file name, the inference backend and the precision).
+
+    Raises:
+        ValueError: If the address is a "host:port" string and INFERENCE_SERVER_AUTHKEY is not set.
+    """
+    listen_address, authkey = _get_connection_args(address)
+    batcher = MicroBatcher(predict_fn, max_batch_size, max_wait)
+
+    if address.startswith("/") and os.path.exists(address):
+        os.remove(address)  # stale socket from a previous run
+
+    with Listener(listen_address, authkey=authkey) as listener:
+        print(f"Inference server listening on {address} (max batch size {max_batch_size}, max wait {max_wait}s)")
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=_handle_connection, args=(connection, batcher, settings or {}), daemon=True).start()
+
+
+def predict_chunks_remote(
+    chunks: list[str], address: str = INFERENCE_SERVER_ADDRESS
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Predict chunks using the inference server.
+
+    Args:
+        chunks (list[str]): Chunks of at most SEQUENCE_MAX_LENGTH residues.
+        address (str): Address of the inference server.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: For every chunk a tuple of the predicted scores and the embeddings.
+
+    Raises:
+        RuntimeError: If the inference server failed to predict the chunks.
+        ValueError: If the address is a "host:port" string and INFERENCE_SERVER_AUTHKEY is not set.
+    """
+    global _remote_settings
+
+    server_address, authkey = _get_connection_args(address)
+    with Client(server_address, authkey=authkey) as connection:
+        connection.send(chunks)
+        response = connection.recv()
+
+    if "error" in response:
+        raise RuntimeError(f"Inference server failed: {response['error']}")
+
+    _remote_settings = response["settings"]
+    return response["results"]
+
+
+def get_remote_settings(address: str = INFERENCE_SERVER_ADDRESS) -> dict[str, str]:
+    """
+    Get the settings of the model served by the inference server. They are queried once per process
+    and updated by every prediction response (e.g. after the server was restarted with another precision).
+
+    Args:
+        address (str): Address of the inference server.
+
+    Returns:
+        dict[str, str]: The model file name, the inference backend and the precision.
+    """
+    global _remote_settings
+
+    if _remote_settings is None:
+        server_address, authkey = _get_connection_args(address)
+        with Client(server_address, authkey=authkey) as connection:
+            connection.send(SETTINGS_REQUEST)
+            _remote_settings = connection.recv()["settings"]
+
+    return _remote_settings
+
+
+def _get_connection_args(address: str) -> tuple[str | tuple[str, int], bytes]:
+    if ":" in address and not address.startswith("/"):
+        if not INFERENCE_SERVER_AUTHKEY:
+            raise ValueError("A TCP inference server address needs an explicit INFERENCE_SERVER_AUTHKEY")
+        host, port = address.rsplit(":", 1)
+        return (host, int(port)), INFERENCE_SERVER_AUTHKEY
+
+    return address, INFERENCE_SERVER_AUTHKEY or UNIX_SOCKET_AUTHKEY
+
+
+if __name__ == "__main__":
+    from prediction.compute_score import predict_chunks
+    from prediction.model_registry import load_models, warmup, get_inference_settings
+
+    load_models()
+    warmup()
+
+    serve(
+        INFERENCE_SERVER_ADDRESS or "/app/data/inference.sock",
+        lambda chunks: predict_chunks(chunks, batch_size=INFERENCE_MAX_BATCH_SIZE),
+        settings=get_inference_settings(),
+    )
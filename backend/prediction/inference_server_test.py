@@ -0,0 +1,80 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from prediction.inference_server import serve, predict_chunks_remote, get_remote_settings
+
+"""This script checks the inference server with a stub model (no GPU, no model weights): concurrent clients
+are coalesced into micro-batches of at most MAX_BATCH_SIZE chunks, every client gets the results of its own chunks,
+model errors are reported to the caller, the server reports the settings of its model (part of the sequence cache key)
+and a TCP address is refused without an explicit authkey.
+Run it from the backend directory: `python -m prediction.inference_server_test`."""
+
+MAX_BATCH_SIZE = 8
+CLIENTS = 20
+EMBEDDING_DIMENSION = 4
+SETTINGS = {"model": "stub.pt", "backend": "torch", "precision": "int8"}
+
+batch_sizes: list[int] = []
+
+
+def stub_predict(chunks: list[str]) -> list[tuple[np.ndarray, np.ndarray]]:
+    if "FAIL" in chunks:
+        raise RuntimeError("stub model failure")
+
+    batch_sizes.append(len(chunks))
+    time.sleep(0.05)  # a forward pass
+
+    # the score of every residue is the length of its chunk, so the results can be matched to the requests
+    return [
+        (np.full(len(chunk), len(chunk), dtype=np.float32), np.zeros((len(chunk), EMBEDDING_DIMENSION), np.float32))
+        for chunk in chunks
+    ]
+
+
+# the listener removes the socket itself when the script exits
+address = os.path.join(tempfile.mkdtemp(), "inference.sock")
+server = threading.Thread(target=serve, args=(address, stub_predict, MAX_BATCH_SIZE, 0.2, SETTINGS), daemon=True)
+server.start()
+
+deadline = time.monotonic() + 10
+while not os.path.exists(address):
+    assert server.is_alive() and time.monotonic() < deadline, "the inference server did not start"
+    time.sleep(0.01)
+
+assert get_remote_settings(address) == SETTINGS
+
+requests = [["A" * (i + 1)] for i in range(CLIENTS)]
+with ThreadPoolExecutor(CLIENTS) as executor:
+    responses = list(executor.map(predict_chunks_remote, requests, [address] * CLIENTS))
+
+for chunks, results in zip(requests, responses):
+    assert len(results) == len(chunks)
+    scores, embeddings = results[0]
+    assert scores.shape == (len(chunks[0]),) and np.all(scores == len(chunks[0]))
+    assert embeddings.shape == (len(chunks[0]), EMBEDDING_DIMENSION)
+
+print(f"{CLIENTS} concurrent clients were served in {len(batch_sizes)} batches of sizes {batch_sizes}")
+assert sum(batch_sizes) == CLIENTS
+assert max(batch_sizes) <= MAX_BATCH_SIZE
+assert len(batch_sizes) < CLIENTS, "the requests were not coalesced"
+
+try:
+    predict_chunks_remote(["FAIL"], address)
+    assert False, "the model error was not reported to the caller"
+except RuntimeError as e:
+    assert "stub model failure" in str(e)
+
+if not os.getenv("INFERENCE_SERVER_AUTHKEY"):
+    try:
+        predict_chunks_remote(["A"], "127.0.0.1:6000")
+        assert False, "a TCP address without an explicit authkey was accepted"
+    except ValueError:
+        pass
+
+print("All inference server checks passed.")
@@ -0,0 +1,192 @@
+import contextlib
+import os
+import resource
+import threading
+
+import torch
+from transformers import AutoTokenizer
+
+from .esm_model import FinetuneESM, ESM_MODEL_NAME, MODEL_PATH, DEVICE, MAX_LENGTH
+from .onnx_backend import OnnxFinetuneESM, load_onnx_model
+
+WARMUP_SEQUENCE = (
+    "MTEYKLVVVGAGGVGKSALTIQLIQNHFVDEYDPTIEDSYRKQVVIDGETCLLDILDTAGQEEYSAMRDQYMRTGEGFLCVFAINNTKSF"
+    "EDIHQYREQIKRVKDSDDVPMVLVGNKCDLAARTVESRQAQDLARSYGIPYIETSAKTRQGVEDAFYTLVREIRQH"
+)
+
+# "torch" (default) or "onnx" (ONNX Runtime on CPU, the model is exported on the first start)
+INFERENCE_BACKEND = os.getenv("CRYPTOBENCH_BACKEND", "torch").lower()
+BACKENDS = ("torch", "onnx")
+
+if INFERENCE_BACKEND not in BACKENDS:
+    raise ValueError(f"Unsupported CRYPTOBENCH_BACKEND: {INFERENCE_BACKEND} (expected one of {BACKENDS})")
+
+# Opt-in reduced precision for CPU inference: "fp32" (default), "int8" (dynamic quantization of the linear layers)
+# or "bf16" (bfloat16 autocast). It is ignored on GPU and by the ONNX backend.
+CPU_PRECISION = os.getenv("CRYPTOBENCH_CPU_PRECISION", "fp32").lower()
+PRECISIONS = ("fp32", "int8", "bf16")
+INFERENCE_PRECISION = CPU_PRECISION if DEVICE == "cpu" and INFERENCE_BACKEND == "torch" else "fp32"
+
+if INFERENCE_PRECISION not in PRECISIONS:
+    raise ValueError(f"Unsupported CRYPTOBENCH_CPU_PRECISION: {CPU_PRECISION} (expected one of {PRECISIONS})")
+
+
+def get_inference_settings() -> dict[str, str]:
+    """
+    Get the settings the predictions of this process depend on (part of the sequence cache key).
+
+    Returns:
+        dict[str, str]: The model file name, the inference backend and the precision.
+    """
+    return {"model": os.path.basename(MODEL_PATH), "backend": INFERENCE_BACKEND, "precision": INFERENCE_PRECISION}
+
+
+_lock = threading.Lock()
+_model: "FinetuneESM | OnnxFinetuneESM | None" = None
+_tokenizer = None
+
+
+def load_models() -> None:
+    """
+    Load the CryptoBench ESM-2 model and its tokenizer into the current process.
+    The model is moved to the device and put into eval mode. Calling this repeatedly is a no-op,
+    the already loaded instance is kept.
+    """
+    global _model, _tokenizer
+
+    with _lock:
+        if _model is not None and _tokenizer is not None:
+            return
+
+        if _tokenizer is None:
+            _tokenizer = AutoTokenizer.from_pretrained(ESM_MODEL_NAME)
+        if INFERENCE_BACKEND == "onnx":
+            _model = load_onnx_model()
+        else:
+            _model = build_model(INFERENCE_PRECISION)
+
+        print(f"Loaded CryptoBench model on {DEVICE} ({INFERENCE_BACKEND}, {INFERENCE_PRECISION})")
+
+
+def build_model(precision: str = "fp32") -> FinetuneESM:
+    """
+    Build a new CryptoBench model instance in eval mode.
+
+    Args:
+        precision (str): One of PRECISIONS. "int8" applies dynamic quantization to the linear layers (CPU only),
+            "bf16" keeps the fp32 weights and relies on `inference_context` for the bfloat16 autocast.
+
+    Returns:
+        FinetuneESM: The loaded model.
+    """
+    model = FinetuneESM(ESM_MODEL_NAME).to(DEVICE)
+    model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE), strict=True)
+    model.eval()
+
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return model  # type: ignore
+
+
+def inference_context(precision: str = INFERENCE_PRECISION):
+    """
+    Get the context manager the forward pass should run in for the given precision.
+
+    Args:
+        precision (str): One of PRECISIONS.
+
+    Returns:
+        contextlib.AbstractContextManager: bfloat16 autocast for "bf16", a no-op context otherwise.
+    """
+    if precision == "bf16":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+
+    return contextlib.nullcontext()
+
+
+def get_model() -> FinetuneESM | OnnxFinetuneESM:
+    """
+    Get the resident CryptoBench model (loads it lazily if the worker did not do it on startup).
+
+    Returns:
+        FinetuneESM | OnnxFinetuneESM: The shared model instance in eval mode.
+    """
+    if _model is None:
+        load_models()
+
+    return _model  # type: ignore
+
+
+def get_tokenizer():
+    """
+    Get the resident ESM-2 tokenizer (loads it lazily if the worker did not do it on startup).
+
+    Returns:
+        PreTrainedTokenizerBase: The shared tokenizer instance.
+    """
+    global _tokenizer
+
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                _tokenizer = AutoTokenizer.from_pretrained(ESM_MODEL_NAME)
+
+    return _tokenizer
+
+
+def warmup() -> None:
+    """
+    Run a single forward pass on a short sequence so that the first real task
+    does not pay for the lazy allocations (kernels, thread pools, ...).
+    """
+    model = get_model()
+    tokenizer = get_tokenizer()
+
+    tokenized = tokenizer(WARMUP_SEQUENCE, max_length=MAX_LENGTH, truncation=True, return_tensors="pt")  # type: ignore
+    tokenized = {k: v.to(DEVICE) for k, v in tokenized.items()}
+
+    with torch.no_grad(), inference_context():
+        model(tokenized)
+
+
+def get_model_memory_footprint() -> dict:
+    """
+    Get the memory footprint of the resident model in the current process.
+
+    Returns:
+        dict: A dictionary containing:
+            - "loaded": Whether the model is loaded in this process.
+            - "device": The device the model lives on.
+            - "backend": The inference backend.
+            - "precision": The inference precision.
+            - "parameters_bytes": Size of the model weights and buffers in bytes.
+            - "cuda_allocated_bytes": Memory allocated by torch on the GPU (0 on CPU).
+            - "max_rss_bytes": Peak resident set size of the process in bytes.
+    """
+    parameters_bytes = 0
+
+    if isinstance(_model, OnnxFinetuneESM):
+        # the weights live in ONNX Runtime, the exported files are the best approximation
+        onnx_directory = os.path.dirname(_model.onnx_model_path)
+        parameters_bytes += sum(
+            os.path.getsize(os.path.join(onnx_directory, f))
+            for f in os.listdir(onnx_directory)
+            if f.startswith(os.path.basename(os.path.splitext(_model.onnx_model_path)[0]))
+        )
+    elif _model is not None:
+        # the state dict (unlike .parameters()) also contains the packed weights of the quantized layers
+        for value in _model.state_dict().values():
+            for tensor in value if isinstance(value, tuple) else (value,):
+                if isinstance(tensor, torch.Tensor):
+                    parameters_bytes += tensor.numel() * tensor.element_size()
+
+    return {
+        "loaded": _model is not None,
+        "device": DEVICE,
+        "backend": INFERENCE_BACKEND,
+        "precision": INFERENCE_PRECISION,
+        "parameters_bytes": parameters_bytes,
+        "cuda_allocated_bytes": torch.cuda.memory_allocated() if torch.cuda.is_available() else 0,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # ru_maxrss is in KB on Linux
+    }
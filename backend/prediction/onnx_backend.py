@@ -0,0 +1,115 @@
+import fcntl
+import os
+
+import numpy as np
+import torch
+
+from .esm_model import FinetuneESM, MODEL_PATH
+
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", os.path.splitext(MODEL_PATH)[0] + ".onnx")
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 lets ONNX Runtime decide
+ONNX_OPSET_VERSION = 17
+
+
+class _ExportWrapper(torch.nn.Module):
+    """Plain-tensor interface of FinetuneESM for the ONNX export (classifier head + last hidden state)."""
+
+    def __init__(self, model: FinetuneESM):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        output, _, _, embeddings = self.model.forward_with_embeddings(
+            {"input_ids": input_ids, "attention_mask": attention_mask}  # type: ignore
+        )
+        return output, embeddings
+
+
+def export_onnx(model: FinetuneESM, onnx_model_path: str = ONNX_MODEL_PATH) -> None:
+    """
+    Export the CryptoBench model to ONNX with a dynamic batch size and sequence length.
+
+    Args:
+        model (FinetuneESM): The loaded model in eval mode (on CPU).
+        onnx_model_path (str): Path where the ONNX model will be saved.
+    """
+    input_ids = torch.ones((1, 16), dtype=torch.int64)
+    attention_mask = torch.ones((1, 16), dtype=torch.int64)
+
+    tmp_path = f"{os.path.splitext(onnx_model_path)[0]}.{os.getpid()}.tmp.onnx"
+    torch.onnx.export(
+        _ExportWrapper(model).eval(),  # the exporter restores the training mode of the wrapper afterwards
+        (input_ids, attention_mask),
+        tmp_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["classifier", "embeddings"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "classifier": {0: "batch", 1: "sequence"},
+            "embeddings": {0: "batch", 1: "sequence"},
+        },
+        opset_version=ONNX_OPSET_VERSION,
+        # the TorchScript exporter, the dynamo exporter (the default since torch 2.9) needs onnxscript
+        dynamo=False,
+    )
+    # the export is slow, a reader must never pick up a half-written file
+    os.replace(tmp_path, onnx_model_path)
+
+
+class OnnxFinetuneESM:
+    """
+    CryptoBench model running in ONNX Runtime, with the same `forward_with_embeddings` interface as FinetuneESM.
+    The pLDDT and distance heads are not exported, they are returned as None.
+    """
+
+    def __init__(self, onnx_model_path: str = ONNX_MODEL_PATH):
+        import onnxruntime as ort  # optional dependency, only needed for CRYPTOBENCH_BACKEND=onnx
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = 1
+
+        self.onnx_model_path = onnx_model_path
+        self.session = ort.InferenceSession(onnx_model_path, options, providers=["CPUExecutionProvider"])
+
+    def forward_with_embeddings(self, batch: dict[str, torch.Tensor]) -> tuple[torch.Tensor, None, None, torch.Tensor]:
+        output, embeddings = self.session.run(
+            ["classifier", "embeddings"],
+            {
+                "input_ids": batch["input_ids"].cpu().numpy().astype(np.int64),
+                "attention_mask": batch["attention_mask"].cpu().numpy().astype(np.int64),
+            },
+        )
+        return torch.from_numpy(output), None, None, torch.from_numpy(embeddings)
+
+    def __call__(self, batch: dict[str, torch.Tensor]) -> tuple[torch.Tensor, None, None]:
+        output, _, _, _ = self.forward_with_embeddings(batch)
+        return output, None, None
+
+
+def load_onnx_model(onnx_model_path: str = ONNX_MODEL_PATH) -> OnnxFinetuneESM:
+    """
+    Load the ONNX model, exporting it from the PyTorch checkpoint first if it does not exist yet.
+    The export holds a file lock, so when all worker processes start at once only the first one exports the model
+    and the others wait for it.
+
+    Args:
+        onnx_model_path (str): Path to the ONNX model.
+
+    Returns:
+        OnnxFinetuneESM: The model running in ONNX Runtime.
+    """
+    if not os.path.exists(onnx_model_path):
+        with open(f"{onnx_model_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if not os.path.exists(onnx_model_path):  # exported by another process while waiting for the lock
+                from .model_registry import build_model
+
+                print(f"Exporting the CryptoBench model to {onnx_model_path}")
+                export_onnx(build_model("fp32").cpu(), onnx_model_path)  # type: ignore
+
+    return OnnxFinetuneESM(onnx_model_path)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from prediction.compute_score import predict_chunks, split_into_chunks
+from prediction.model_registry import build_model
+from prediction.onnx_backend import load_onnx_model
+
+"""This script compares the per-residue scores and embeddings of the ONNX Runtime backend against the PyTorch model.
+The ONNX model is exported first if it does not exist yet.
+Run it inside a CPU worker container with the `onnx` extra installed: `python -m prediction.onnx_parity_test`."""
+
+TOLERANCE = 1e-3
+
+np.random.seed(42)
+amino_acids = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+sequences = ["".join(np.random.choice(amino_acids, size=length)) for length in (35, 120, 300, 1022, 1500)]
+
+chunks = [chunk for sequence in sequences for chunk in split_into_chunks(sequence)]
+
+reference = predict_chunks(chunks, model=build_model("fp32"), precision="fp32")
+onnx = predict_chunks(chunks, model=load_onnx_model(), precision="fp32")
+
+for chunk, (reference_scores, reference_embeddings), (scores, embeddings) in zip(chunks, reference, onnx):
+    assert reference_scores.shape == scores.shape == (len(chunk),)
+    assert reference_embeddings.shape == embeddings.shape
+
+    score_deviation = np.abs(reference_scores - scores).max()
+    embedding_deviation = np.abs(reference_embeddings - embeddings).max()
+    print(
+        f"Chunk of length {len(chunk)}: score deviation {score_deviation:.2e}, "
+        f"embedding deviation {embedding_deviation:.2e}"
+    )
+
+    assert score_deviation < TOLERANCE, f"Scores differ for the chunk of length {len(chunk)}"
+
+print("The ONNX backend matches the PyTorch model.")
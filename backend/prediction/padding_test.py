@@ -0,0 +1,33 @@
+import numpy as np
+
+from prediction.compute_score import predict_chunks, split_into_chunks
+
+"""This script compares the per-residue scores and embeddings of the dynamic padding path
+(batched, padded to the longest chunk) against the fixed-padding path (batch size 1, padded to 1024 tokens).
+Run it inside a worker container: `python -m prediction.padding_test`."""
+
+TOLERANCE = 1e-4
+
+np.random.seed(42)
+amino_acids = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+sequences = ["".join(np.random.choice(amino_acids, size=length)) for length in (35, 120, 121, 300, 1022, 1500)]
+
+chunks = [chunk for sequence in sequences for chunk in split_into_chunks(sequence)]
+
+reference = predict_chunks(chunks, padding="max_length", batch_size=1)
+dynamic = predict_chunks(chunks, padding="longest")
+
+for chunk, (reference_scores, reference_embeddings), (scores, embeddings) in zip(chunks, reference, dynamic):
+    assert reference_scores.shape == scores.shape == (len(chunk),)
+    assert reference_embeddings.shape == embeddings.shape
+
+    score_deviation = np.abs(reference_scores - scores).max()
+    embedding_deviation = np.abs(reference_embeddings - embeddings).max()
+    print(
+        f"Chunk of length {len(chunk)}: score deviation {score_deviation:.2e}, "
+        f"embedding deviation {embedding_deviation:.2e}"
+    )
+
+    assert score_deviation < TOLERANCE, f"Scores differ for the chunk of length {len(chunk)}"
+
+print("Dynamic padding matches the fixed-padding path.")
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+import numpy as np
+import biotite.structure.io.pdbx as pdbx
+import biotite.structure.io.pdb as pdb
+from biotite.sequence import ProteinSequence
+from sklearn.metrics import adjusted_rand_score
+
+from clustering import compute_clusters
+from prediction.compute_score import predict_chunks, split_into_chunks
+from prediction.model_registry import build_model, PRECISIONS
+
+"""This script measures how much a reduced inference precision changes the CryptoBench output compared to float32.
+For every reference structure it reports the score deviation, the agreement of the binding residues (score > 0.7)
+and the agreement of the DBSCAN pockets, together with the speedup of the forward passes.
+Run it inside a CPU worker container:
+`python -m prediction.precision_harness <directory with .cif/.pdb files> [int8|bf16]`."""
+
+BINDING_THRESHOLD = 0.7
+
+
+def load_reference_structure(structure_file_path: str) -> tuple[dict[str, str], np.ndarray]:
+    if structure_file_path.endswith(".cif"):
+        protein = pdbx.get_structure(pdbx.CIFFile.read(structure_file_path), model=1)
+    else:
+        protein = pdb.get_structure(pdb.PDBFile.read(structure_file_path), model=1)
+
+    protein = protein[(protein.atom_name == "CA") & (protein.element == "C")]  # type: ignore
+
+    sequences_by_chain: dict[str, str] = {}
+    for residue in protein:
+        one_letter = (
+            ProteinSequence.convert_letter_3to1(residue.res_name)
+            if residue.res_name in ProteinSequence._dict_3to1
+            else "X"
+        )
+        sequences_by_chain[residue.chain_id] = sequences_by_chain.get(residue.chain_id, "") + one_letter
+
+    # order the coordinates the same way as the sequences (chain by chain)
+    coordinates = np.concatenate([protein.coord[protein.chain_id == chain] for chain in sequences_by_chain])
+
+    return sequences_by_chain, coordinates
+
+
+def predict(sequences_by_chain: dict[str, str], model, precision: str) -> tuple[np.ndarray, float]:
+    chunks = [chunk for sequence in sequences_by_chain.values() for chunk in split_into_chunks(sequence)]
+
+    start = time.perf_counter()
+    results = predict_chunks(chunks, model=model, precision=precision)
+    elapsed = time.perf_counter() - start
+
+    return np.concatenate([scores for scores, _ in results]), elapsed
+
+
+def pocket_jaccard(reference_clusters: np.ndarray, clusters: np.ndarray) -> float:
+    reference_pocket_residues = reference_clusters != -1
+    pocket_residues = clusters != -1
+
+    union = np.sum(reference_pocket_residues | pocket_residues)
+    if union == 0:
+        return 1.0
+
+    return float(np.sum(reference_pocket_residues & pocket_residues) / union)
+
+
+reference_directory = sys.argv[1]
+precision = sys.argv[2] if len(sys.argv) > 2 else "int8"
+
+if precision not in PRECISIONS:
+    raise ValueError(f"Unsupported precision: {precision} (expected one of {PRECISIONS})")
+
+reference_model = build_model("fp32")
+model = build_model(precision)
+
+structure_files = sorted(f for f in os.listdir(reference_directory) if f.lower().endswith((".cif", ".pdb")))
+total_reference_time = total_time = 0.0
+
+for structure_file in structure_files:
+    sequences_by_chain, coordinates = load_reference_structure(os.path.join(reference_directory, structure_file))
+
+    reference_scores, reference_time = predict(sequences_by_chain, reference_model, "fp32")
+    scores, elapsed = predict(sequences_by_chain, model, precision)
+    total_reference_time += reference_time
+    total_time += elapsed
+
+    deviation = np.abs(reference_scores - scores)
+    binding_agreement = np.mean((reference_scores > BINDING_THRESHOLD) == (scores > BINDING_THRESHOLD))
+
+    reference_clusters = compute_clusters(coordinates.tolist(), reference_scores.tolist())
+    clusters = compute_clusters(coordinates.tolist(), scores.tolist())
+
+    print(
+        f"{structure_file}: max deviation {deviation.max():.4f}, mean deviation {deviation.mean():.4f}, "
+        f"binding agreement {binding_agreement:.4f}, "
+        f"pocket residue Jaccard {pocket_jaccard(reference_clusters, clusters):.4f}, "
+        f"cluster ARI {adjusted_rand_score(reference_clusters, clusters):.4f}, "
+        f"speedup {reference_time / elapsed:.2f}x"
+    )
+
+print(f"{len(structure_files)} structures, overall {precision} speedup {total_reference_time / total_time:.2f}x")
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import uuid
+
+import numpy as np
+
+from commons import APP_BASE_PATH
+from .model_registry import get_inference_settings
+
+SEQUENCE_CACHE_PATH = os.getenv("SEQUENCE_CACHE_PATH", os.path.join(APP_BASE_PATH, "cache", "sequences"))
+SEQUENCE_CACHE_MAX_BYTES = int(os.getenv("SEQUENCE_CACHE_MAX_BYTES", str(5 * 1024**3)))  # 0 disables the cache
+
+
+def get_sequence_hash(sequence: str, settings: dict[str, str] | None = None) -> str:
+    """
+    Calculate the cache key of a sequence. The model file, the inference backend and the precision are part
+    of the key, so a new model or a reduced-precision worker never shares entries with the float32 ones.
+
+    Args:
+        sequence (str): Sequence of amino acids.
+        settings (dict[str, str] | None): Settings of the process that predicts the sequence
+            (the inference server if the work is delegated), by default the settings of this process.
+
+    Returns:
+        str: The SHA256 hex digest identifying the sequence.
+    """
+    settings = settings or get_inference_settings()
+    key = f"{settings['model']}:{settings['backend']}:{settings['precision']}:{sequence}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_file(sequence: str, settings: dict[str, str] | None) -> str:
+    return os.path.join(SEQUENCE_CACHE_PATH, f"{get_sequence_hash(sequence, settings)}.npz")
+
+
+def get_cached_prediction(
+    sequence: str, settings: dict[str, str] | None = None
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Look up the CryptoBench scores and embeddings of a sequence in the cache.
+
+    Args:
+        sequence (str): Sequence of amino acids.
+        settings (dict[str, str] | None): Settings of the predicting process, see `get_sequence_hash`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray] | None: The scores and the embeddings if the sequence is cached, otherwise None.
+    """
+    if SEQUENCE_CACHE_MAX_BYTES <= 0:
+        return None
+
+    path = _cache_file(sequence, settings)
+
+    try:
+        with np.load(path) as data:
+            scores, embeddings = data["scores"], data["embeddings"]
+        os.utime(path)  # mark as recently used
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+    return scores, embeddings
+
+
+def cache_prediction(
+    sequence: str, scores: np.ndarray, embeddings: np.ndarray, settings: dict[str, str] | None = None
+) -> None:
+    """
+    Store the CryptoBench scores and embeddings of a sequence and evict the least recently used entries
+    if the cache grew over SEQUENCE_CACHE_MAX_BYTES.
+
+    Args:
+        sequence (str): Sequence of amino acids.
+        scores (np.ndarray): The predicted scores for each residue.
+        embeddings (np.ndarray): The embeddings for each residue.
+        settings (dict[str, str] | None): Settings of the process that predicted the sequence, see `get_sequence_hash`.
+    """
+    if SEQUENCE_CACHE_MAX_BYTES <= 0:
+        return
+
+    os.makedirs(SEQUENCE_CACHE_PATH, exist_ok=True)
+
+    # write to a temporary file first, so that concurrent workers never read a partial entry
+    tmp_path = os.path.join(SEQUENCE_CACHE_PATH, f".{uuid.uuid4()}.npz")
+    np.savez(tmp_path, scores=scores, embeddings=embeddings)
+    os.replace(tmp_path, _cache_file(sequence, settings))
+
+    _evict()
+
+
+def _evict() -> None:
+    entries = []
+    for entry in os.scandir(SEQUENCE_CACHE_PATH):
+        if entry.name.endswith(".npz") and not entry.name.startswith("."):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total_size <= SEQUENCE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # already evicted by another worker
+        total_size -= size
@@ -0,0 +1,147 @@
+import asyncio
+import os
+
+import httpx
+
+# the base URLs can point to a local mirror (or a fake server in tests)
+RCSB_FILES_URL = os.getenv("RCSB_FILES_URL", "https://files.rcsb.org/download")
+RCSB_MODELS_URL = os.getenv("RCSB_MODELS_URL", "https://models.rcsb.org")
+ALPHAFOLD_FILES_URL = os.getenv("ALPHAFOLD_FILES_URL", "https://alphafold.ebi.ac.uk/files")
+
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))  # seconds
+DOWNLOAD_MAX_CONCURRENCY = int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", "8"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+DOWNLOAD_RETRY_BACKOFF = 0.5  # seconds, doubled after every attempt
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes, the response body is streamed to the file
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class StructureDownloadError(Exception):
+    """Raised when a database could not be reached (all attempts failed), as opposed to a missing structure."""
+
+
+def create_download_client() -> httpx.AsyncClient:
+    """Create the connection-pooled HTTP client shared by all structure downloads.
+
+    Returns:
+        The client (to be closed on application shutdown).
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(DOWNLOAD_TIMEOUT, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=DOWNLOAD_MAX_CONCURRENCY, max_keepalive_connections=DOWNLOAD_MAX_CONCURRENCY
+        ),
+        follow_redirects=True,
+    )
+
+
+class StructureDownloader:
+    """Asynchronous download of structures from RCSB PDB and AlphaFold DB.
+
+    The number of concurrent downloads is bounded, transient failures (connection errors,
+    timeouts, 429 and 5xx responses) are retried with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        max_concurrency: int = DOWNLOAD_MAX_CONCURRENCY,
+        retries: int = DOWNLOAD_RETRIES,
+        rcsb_files_url: str = RCSB_FILES_URL,
+        rcsb_models_url: str = RCSB_MODELS_URL,
+        alphafold_files_url: str = ALPHAFOLD_FILES_URL,
+    ):
+        self.client = client
+        self.retries = retries
+        self.rcsb_files_url = rcsb_files_url.rstrip("/")
+        self.rcsb_models_url = rcsb_models_url.rstrip("/")
+        self.alphafold_files_url = alphafold_files_url.rstrip("/")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def get_urls(self, structure_id: str) -> list[tuple[str, str]]:
+        """Get the candidate URLs of a structure, in the order of preference (BinaryCIF first).
+
+        Args:
+            structure_id: A 4-character PDB ID or a UniProt ID.
+
+        Returns:
+            A list of (URL, file extension) pairs.
+        """
+        if len(structure_id) == 4:
+            return [
+                (f"{self.rcsb_models_url}/{structure_id}.bcif", "bcif"),
+                (f"{self.rcsb_files_url}/{structure_id}.cif", "cif"),
+            ]
+
+        return [
+            (f"{self.alphafold_files_url}/AF-{structure_id}-F1-model_v6.bcif", "bcif"),
+            (f"{self.alphafold_files_url}/AF-{structure_id}-F1-model_v6.cif", "cif"),
+        ]
+
+    async def fetch(self, url: str, file_path: str) -> bool:
+        """Stream a URL to a file, retrying transient failures.
+        The body is written to a temporary file next to `file_path`, which is renamed once the body is complete.
+
+        Args:
+            url: The URL to fetch.
+            file_path: Where the response body will be saved.
+
+        Returns:
+            True if the file was saved, False if the resource does not exist.
+
+        Raises:
+            StructureDownloadError: If all attempts failed.
+        """
+        tmp_path = f"{file_path}.part"
+        backoff = DOWNLOAD_RETRY_BACKOFF
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self._semaphore, self.client.stream("GET", url) as response:
+                        if response.status_code == 200:
+                            # a retry starts the file over
+                            with open(tmp_path, "wb") as f:
+                                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                                    f.write(chunk)
+
+                            os.replace(tmp_path, file_path)
+                            return True
+
+                        if response.status_code not in RETRY_STATUS_CODES:
+                            return False
+
+                except httpx.TransportError:
+                    pass  # connection errors and timeouts (also in the middle of the body) are retried
+
+                if attempt < self.retries:
+                    await asyncio.sleep(backoff)
+                    backoff *= 2
+
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        raise StructureDownloadError(f"Could not fetch {url} ({self.retries + 1} attempts)")
+
+    async def download(self, structure_id: str, directory: str) -> str:
+        """Download a structure from RCSB PDB (4-character IDs) or AlphaFold DB (UniProt IDs).
+
+        Args:
+            structure_id: A 4-character PDB ID or a UniProt ID.
+            directory: The directory where the file will be saved.
+
+        Returns:
+            The path to the downloaded .bcif or .cif file, or an empty string ("")
+            if the structure does not exist.
+
+        Raises:
+            StructureDownloadError: If the database could not be reached.
+        """
+        for url, extension in self.get_urls(structure_id):
+            file_path = os.path.join(directory, f"{structure_id}.{extension}")
+            if await self.fetch(url, file_path):
+                return file_path
+
+        return ""
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from structure_download import StructureDownloader, StructureDownloadError, create_download_client
+
+"""This script checks the structure downloads against a local fake RCSB PDB / AlphaFold DB server:
+the BinaryCIF file is preferred, the mmCIF file is the fallback, transient errors are retried,
+unknown IDs give an empty path (an unreachable server raises an error instead), a body cut off in the middle
+is downloaded again (no partial files are left) and concurrent downloads are bounded.
+Run it from the backend directory: `python -m structure_download_test`."""
+
+FILES = {
+    "/models/1abc.bcif": b"bcif content",
+    "/files/2abc.cif": b"cif content",
+    "/models/3abc.bcif": b"flaky content",
+    "/models/4abc.bcif": b"unreachable content",
+    "/af/AF-P12345-F1-model_v6.bcif": b"alphafold bcif content",
+    "/models/5abc.bcif": os.urandom(5 * 1024**2),  # a large assembly, streamed in chunks
+}
+FLAKY_PATHS = {"/models/3abc.bcif": 2, "/models/4abc.bcif": 10}  # path -> number of 503 responses before success
+TRUNCATED_PATHS = {"/models/5abc.bcif": 1}  # path -> number of responses cut off in the middle of the body
+RESPONSE_DELAY = 0.05  # seconds
+
+requests: list[str] = []
+in_flight = max_in_flight = 0
+lock = threading.Lock()
+
+
+class FakeServerHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        global in_flight, max_in_flight
+
+        with lock:
+            requests.append(self.path)
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+
+        time.sleep(RESPONSE_DELAY)
+
+        with lock:
+            in_flight -= 1
+            flaky = FLAKY_PATHS.get(self.path, 0)
+            if flaky:
+                FLAKY_PATHS[self.path] = flaky - 1
+            truncated = TRUNCATED_PATHS.get(self.path, 0)
+            if truncated:
+                TRUNCATED_PATHS[self.path] = truncated - 1
+
+        if flaky:
+            self.send_response(503)
+            self.end_headers()
+        elif self.path in FILES:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(FILES[self.path])))
+            self.end_headers()
+            # a truncated response closes the connection after half of the body
+            self.wfile.write(FILES[self.path][: len(FILES[self.path]) // 2] if truncated else FILES[self.path])
+            self.close_connection = bool(truncated)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def main(base_url: str, directory: str):
+    async with create_download_client() as client:
+        downloader = StructureDownloader(
+            client,
+            max_concurrency=4,
+            rcsb_files_url=f"{base_url}/files",
+            rcsb_models_url=f"{base_url}/models",
+            alphafold_files_url=f"{base_url}/af",
+        )
+
+        path = await downloader.download("1abc", directory)
+        assert path == os.path.join(directory, "1abc.bcif"), path
+        with open(path, "rb") as f:
+            assert f.read() == FILES["/models/1abc.bcif"]
+
+        path = await downloader.download("2abc", directory)
+        assert path == os.path.join(directory, "2abc.cif"), path
+        assert "/models/2abc.bcif" in requests
+
+        path = await downloader.download("P12345", directory)
+        assert path == os.path.join(directory, "P12345.bcif"), path
+
+        path = await downloader.download("3abc", directory)
+        assert path == os.path.join(directory, "3abc.bcif"), path
+        assert requests.count("/models/3abc.bcif") == 3
+
+        assert await downloader.download("9zzz", directory) == ""
+        assert not os.path.exists(os.path.join(directory, "9zzz.bcif"))
+
+        path = await downloader.download("5abc", directory)
+        with open(path, "rb") as f:
+            assert f.read() == FILES["/models/5abc.bcif"], "the retried download must start the file over"
+        assert requests.count("/models/5abc.bcif") == 2
+
+        try:
+            await downloader.download("4abc", directory)
+            assert False, "an unreachable structure must not be reported as missing"
+        except StructureDownloadError:
+            pass
+
+        # many concurrent requests (the unknown IDs do not create any files)
+        start = time.perf_counter()
+        paths = await asyncio.gather(*(downloader.download(f"{i}zzz", directory) for i in range(16)))
+        elapsed = time.perf_counter() - start
+        assert paths == [""] * 16
+        assert max_in_flight <= 4, max_in_flight
+        assert not [name for name in os.listdir(directory) if name.endswith(".part")], "a partial file was left"
+
+    print(f"32 requests in {elapsed * 1000:.0f} ms with at most {max_in_flight} in flight")
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeServerHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+try:
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(main(f"http://127.0.0.1:{server.server_address[1]}", directory))
+finally:
+    server.shutdown()
+
+print("All structure download checks passed.")
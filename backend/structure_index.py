@@ -0,0 +1,120 @@
+import os
+import re
+import sqlite3
+import time
+
+from commons import APP_BASE_PATH
+
+STRUCTURE_INDEX_PATH = os.getenv("STRUCTURE_INDEX_PATH", os.path.join(APP_BASE_PATH, "cache", "structure_index.db"))
+# invalid IDs are remembered for a day only, the databases release new entries every week
+STRUCTURE_INDEX_NEGATIVE_TTL = float(os.getenv("STRUCTURE_INDEX_NEGATIVE_TTL", str(24 * 60 * 60)))  # seconds
+
+PDB_ID_PATTERN = re.compile(r"[0-9][A-Z0-9]{3}")
+# the UniProt accession format, https://www.uniprot.org/help/accession_numbers
+UNIPROT_ID_PATTERN = re.compile(r"[OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9]([A-Z][A-Z0-9]{2}[0-9]){1,2}")
+
+
+def normalize_structure_id(structure_id: str) -> str:
+    """Normalize a structure ID, PDB IDs and UniProt IDs are case-insensitive.
+
+    Args:
+        structure_id: A 4-character PDB ID or a UniProt ID.
+
+    Returns:
+        The lowercase PDB ID or the uppercase UniProt ID.
+    """
+    structure_id = structure_id.strip()
+    return structure_id.lower() if len(structure_id) == 4 else structure_id.upper()
+
+
+def is_valid_structure_id(structure_id: str) -> bool:
+    """Check if a structure ID has the format of a PDB ID or a UniProt accession (case-insensitive).
+
+    Args:
+        structure_id: The ID to check.
+
+    Returns:
+        True if the ID can be downloaded (and indexed), otherwise False.
+    """
+    structure_id = structure_id.strip().upper()
+    return bool(PDB_ID_PATTERN.fullmatch(structure_id) or UNIPROT_ID_PATTERN.fullmatch(structure_id))
+
+
+class StructureIndex:
+    """Persistent mapping of the PDB / UniProt IDs to the MD5 hash of their downloaded structure
+    (the name of the job directory), so that known structures need no download.
+
+    IDs that do not exist are stored too (with an empty hash) and expire after `negative_ttl` seconds,
+    only well-formed IDs (see `is_valid_structure_id`) are stored, so the table cannot grow with junk.
+    The methods block on the database, call them from the thread pool.
+    """
+
+    def __init__(self, path: str = STRUCTURE_INDEX_PATH, negative_ttl: float = STRUCTURE_INDEX_NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")  # readers never wait for a writer
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS structures ("
+                    "structure_id TEXT PRIMARY KEY, md5 TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per call, the API serves the requests from several threads (and processes)
+        return sqlite3.connect(self.path, timeout=10)
+
+    def lookup(self, structure_id: str) -> str | None:
+        """Look up the MD5 hash of a structure.
+
+        Args:
+            structure_id: A 4-character PDB ID or a UniProt ID.
+
+        Returns:
+            The MD5 hex digest, an empty string ("") if the ID is known not to exist,
+            or None if the ID is not indexed (or its negative entry expired).
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT md5, updated_at FROM structures WHERE structure_id = ?", (normalize_structure_id(structure_id),)
+            ).fetchone()
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+
+        md5, updated_at = row
+        if not md5 and time.time() - updated_at > self.negative_ttl:
+            return None
+
+        return md5
+
+    def record(self, structure_id: str, md5: str) -> None:
+        """Store the MD5 hash of a downloaded structure, or an empty string ("") if the ID does not exist.
+
+        Args:
+            structure_id: A 4-character PDB ID or a UniProt ID.
+            md5: The MD5 hex digest of the downloaded file.
+
+        Raises:
+            ValueError: If the ID is not a PDB ID or a UniProt accession.
+        """
+        if not is_valid_structure_id(structure_id):
+            raise ValueError(f"Invalid structure ID: {structure_id}")
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO structures (structure_id, md5, updated_at) VALUES (?, ?, ?)",
+                    (normalize_structure_id(structure_id), md5, time.time()),
+                )
+        finally:
+            connection.close()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import time
+
+from structure_index import StructureIndex, is_valid_structure_id
+
+"""This script checks the structure index: the stored hashes survive a restart, the IDs are case-insensitive,
+the negative entries of invalid IDs expire and malformed IDs are never stored.
+Run it from the backend directory: `python -m structure_index_test`."""
+
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "cache", "structure_index.db")
+
+    index = StructureIndex(path, negative_ttl=0.5)
+    assert index.lookup("2src") is None
+
+    index.record("2SRC", "0123456789abcdef0123456789abcdef")
+    index.record("p12345", "fedcba9876543210fedcba9876543210")
+    index.record("9zzz", "")
+
+    # a new instance (e.g. after a restart of the API) reads the same database
+    index = StructureIndex(path, negative_ttl=0.5)
+    assert index.lookup("2src") == "0123456789abcdef0123456789abcdef"
+    assert index.lookup(" 2Src ") == "0123456789abcdef0123456789abcdef"
+    assert index.lookup("P12345") == "fedcba9876543210fedcba9876543210"
+    assert index.lookup("9zzz") == ""
+
+    time.sleep(0.6)
+    assert index.lookup("9zzz") is None, "the negative entry should have expired"
+    assert index.lookup("2src") == "0123456789abcdef0123456789abcdef", "the hashes never expire"
+
+    # a structure released later replaces its negative entry
+    index.record("9zzz", "00000000000000000000000000000000")
+    assert index.lookup("9ZZZ") == "00000000000000000000000000000000"
+
+    for structure_id in ("2src", "1ABC", "P12345", "q9h0h5", "A0A023GPI8"):
+        assert is_valid_structure_id(structure_id), structure_id
+
+    for structure_id in ("", "src2", "abc", "12345", "P1234", "../etc", "2src; --", "X" * 7):
+        assert not is_valid_structure_id(structure_id), structure_id
+        try:
+            index.record(structure_id, "")
+            assert False, f"the malformed ID {structure_id!r} was stored"
+        except ValueError:
+            pass
+
+print("All structure index checks passed.")
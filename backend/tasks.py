@@ -1,25 +1,45 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
+from billiard.process import current_process
 import torch
 import os
 import json
 import shutil
+import numpy as np
 from collections import defaultdict
 
-import biotite.structure.io.pdbx as pdbx
-import biotite.structure.io.pdb as pdb
-from biotite.structure import AtomArray
-from biotite.sequence import ProteinSequence
-
-from Bio.PDB.MMCIFParser import MMCIFParser
-from Bio.PDB.mmcifio import MMCIFIO
-from Bio.PDB.PDBParser import PDBParser
-from Bio.PDB.PDBIO import PDBIO
-
-from prediction import compute_prediction
-from clustering import compute_clusters, refine_clusters
+from prediction import (
+    compute_predictions,
+    EmbeddingStore,
+    load_models,
+    warmup,
+    get_model_memory_footprint,
+    INFERENCE_SERVER_ADDRESS,
+)
+from clustering import (
+    compute_clusters,
+    refine_clusters,
+    group_pockets,
+    get_smoothing_model,
+    build_cluster_graph,
+    save_cluster_graph,
+    load_cluster_graph,
+    cluster_with_graph,
+)
 from trajectory_generator import compute_trajectory
-from utils import get_file_hash, FirstModelSelect
-from commons import JOBS_BASE_PATH
+from ingestion import (
+    ingest_structure,
+    read_structure,
+    build_residue_table,
+    save_residue_table,
+    load_residue_table,
+    get_chain_order,
+    get_sequences_by_chain,
+    get_residue_ids,
+)
+from utils import get_file_hash, get_recluster_results_filename
+from worker_topology import apply_topology, start_metrics_server
+from commons import JOBS_BASE_PATH, RESULTS_VERSION
 
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "defaultRedis")
 
@@ -36,6 +56,28 @@ celery_app = Celery(
 )
 
 
+@worker_init.connect
+def expose_worker_topology(**kwargs):
+    """Expose the CPU worker layout as Prometheus metrics (only if started through `worker_topology`)."""
+    start_metrics_server()
+
+
+@worker_process_init.connect
+def load_models_on_worker_start(**kwargs):
+    """Load the CryptoBench and smoothing models once per worker process, so that the tasks share the same instances."""
+    # pin the process to its cores before torch spins up its thread pools
+    apply_topology(current_process().index or 0)
+
+    get_smoothing_model()
+
+    if INFERENCE_SERVER_ADDRESS:
+        # the model lives in the inference server process
+        return
+
+    load_models()
+    warmup()
+
+
 @celery_app.task(name="celery_app.cuda_test", bind=True)
 def process_string_test(self):
     """CUDA availability test.
@@ -46,6 +88,16 @@ def process_string_test(self):
     return {"device": "cuda" if torch.cuda.is_available() else "cpu"}
 
 
+@celery_app.task(name="celery_app.model_status", bind=True)
+def model_status(self):
+    """Memory footprint of the resident CryptoBench model in the worker process.
+
+    Returns:
+        dict: A dictionary describing the loaded model and its memory usage.
+    """
+    return get_model_memory_footprint()
+
+
 @celery_app.task(name="celery_app.process_esm2_cryptobench", bind=True)
 def process_esm2_cryptobench(self, structure_path_original: str, structure_name: str):
     """Runs the CryptoBench model on a 3D structure.
@@ -81,69 +133,8 @@ def process_esm2_cryptobench(self, structure_path_original: str, structure_name:
 
     self.update_state(state="PROGRESS", meta={"status": "Processing the structure"})
 
-    if structure_path_original.lower().endswith(".cif"):
-        structure_file_path = os.path.join(JOB_PATH, "structure.cif")
-
-        # Keep just the first model in the file
-        parser = MMCIFParser(QUIET=True)
-        structure = parser.get_structure("protein", structure_path_original)
-
-        io = MMCIFIO()
-        io.set_structure(structure)
-        io.save(structure_file_path, select=FirstModelSelect())
-
-        # Extract header information from the original file
-        header_lines = []
-        with open(structure_path_original, "r") as f:
-            for line in f:
-                if line.startswith(("_entry.id")):
-                    header_lines.append(line)
-
-        with open(structure_file_path, "r") as f:
-            content = f.readlines()
-
-        with open(structure_file_path, "w") as f:
-            f.write("data_protein\n")
-            for line in header_lines:
-                f.write(line)
-            # Skip the first line of content (data_protein)
-            f.writelines(content[1:])
-
-        structure_file = pdbx.CIFFile.read(structure_file_path)
-        protein = pdbx.get_structure(structure_file, model=1)  # type: ignore
-
-    elif structure_path_original.lower().endswith((".pdb", ".pdb1")):
-        structure_file_path = os.path.join(JOB_PATH, "structure.pdb")
-        # Keep just the first model in the file
-        parser = PDBParser(QUIET=True)
-        structure = parser.get_structure("protein", structure_path_original)
-
-        io = PDBIO()
-        io.set_structure(structure)
-        io.save(structure_file_path, select=FirstModelSelect())
-
-        # Extract header information from the original file
-        header_lines = []
-        with open(structure_path_original, "r") as f:
-            for line in f:
-                if line.startswith(("HEADER", "TITLE", "COMPND", "SOURCE")):
-                    header_lines.append(line)
-
-        with open(structure_file_path, "r") as f:
-            content = f.read()
-
-        with open(structure_file_path, "w") as f:
-            for line in header_lines:
-                f.write(line)
-            f.write(content)
-
-        structure_file = pdb.PDBFile.read(structure_file_path)
-        protein = pdb.get_structure(structure_file, model=1)  # type: ignore
-
-    else:
-        # This should be checked by the `main.py`, but for the sake of
-        # completeness, we will raise an error here as well
-        raise ValueError("Unsupported file format")
+    # parse the structure once: keep the first model with its header and write the residue table
+    structure_file_path, residue_table = ingest_structure(structure_path_original, JOB_PATH)
 
     # Remove the original folder and all its contents
     if os.path.exists(os.path.dirname(structure_path_original)):
@@ -151,24 +142,8 @@ def process_esm2_cryptobench(self, structure_path_original: str, structure_name:
 
     self.update_state(state="PROGRESS", meta={"status": "Extracting sequence from PDB file"})
 
-    protein: AtomArray = protein[(protein.atom_name == "CA") & (protein.element == "C")]  # type: ignore
-
-    sequences_by_chain = defaultdict(list)
-
-    for residue in protein:
-        chain_id = residue.chain_id
-        one_letter = (
-            ProteinSequence.convert_letter_3to1(residue.res_name)
-            if residue.res_name in ProteinSequence._dict_3to1
-            else "X"
-        )
-        sequences_by_chain[chain_id].append(one_letter)
+    sequences_by_chain = get_sequences_by_chain(residue_table)
 
-    sequences_by_chain = {chain: "".join(seq) for chain, seq in sequences_by_chain.items()}
-
-    coordinates = []
-    cryptobench_prediction = []
-    seq = []
     sequence_files = []
 
     for chain, sequence in sequences_by_chain.items():
@@ -182,98 +157,58 @@ def process_esm2_cryptobench(self, structure_path_original: str, structure_name:
         print(f"Saved sequence file for chain {chain} to {SEQUENCE_FILE}")
 
     for chain, sequence in sequences_by_chain.items():
-        SEQUENCE_FILE = os.path.join(JOB_PATH, f"seq_{chain}.fasta")
-
-        self.update_state(state="PROGRESS", meta={"status": f"Running CryptoBench prediction for chain {chain}"})
+        if not sequence.strip():
+            raise ValueError(f"Empty sequence for chain {chain}")
 
-        # run the cryptobench model for this chain
-        with open(SEQUENCE_FILE, "r") as f:
-            sequence_content = f.read().strip()
+    self.update_state(state="PROGRESS", meta={"status": "Running CryptoBench prediction"})
 
-        if not sequence_content:
-            raise ValueError(f"Empty sequence for chain {chain} in file {SEQUENCE_FILE}")
-
-        chain_pred = compute_prediction(sequence_content, JOB_PATH, chain)
+    def report_chain_done(chain: str, finished: int, total: int):
         print(f"Got prediction for chain {chain} from CryptoBench")
+        self.update_state(
+            state="PROGRESS",
+            meta={"status": f"Running CryptoBench prediction ({finished}/{total} chains done, last: {chain})"},
+        )
 
-        chain_residues = [r for r in protein if r.chain_id == chain]
-        seq.extend(list(sequence))
-
-        for residue in chain_residues:
-            coordinates.append(residue.coord)
-
-        cryptobench_prediction.extend([float(p) for p in chain_pred])
-
-    coordinates = [[float(c) for c in coord] for coord in coordinates]
+    # run the cryptobench model for all chains at once
+    embedding_store = EmbeddingStore(JOB_PATH)
+    predictions_by_chain = compute_predictions(sequences_by_chain, embedding_store, report_chain_done)
+
+    # the residues chain by chain, the same order as the sequences and the predictions
+    _, chain_order, _ = get_chain_order(residue_table)
+    coordinates = residue_table["coord"][chain_order]
+    seq = list("".join(sequences_by_chain.values()))
+    cryptobench_prediction = (
+        np.concatenate([predictions_by_chain[chain] for chain in sequences_by_chain]).astype(np.float64).tolist()
+    )
     print(f"Extracted 3D coordinates for all chains")
 
     # run clustering
     clusters = compute_clusters(coordinates, cryptobench_prediction)
     clusters = [int(p) for p in clusters]
 
+    # precompute the radius graph for fast clustering with other thresholds (see `/clusters/{task_hash}`)
+    residue_ids = get_residue_ids(residue_table)
+    save_cluster_graph(build_cluster_graph(coordinates, cryptobench_prediction, residue_ids), JOB_PATH)
+
     # refine clusters by using smoothing model
     self.update_state(state="PROGRESS", meta={"status": "Refining clusters"})
-    clusters = refine_clusters(clusters, coordinates, JOB_PATH, structure_file_path, sequences_by_chain)
-
-    # group residues into pockets
-    pocket_groups = {}
-    for i, pocket in enumerate(clusters):
-        if pocket == -1:
-            continue
-
-        if pocket not in pocket_groups:
-            pocket_groups[pocket] = {
-                "pocket_id": pocket,
-                "residue_ids": [],
-                "prediction": [],
-                "average_prediction": 0,
-            }
-        pocket_groups[pocket]["residue_ids"].append(f"{protein[i].chain_id}_{protein[i].res_id}")
-        pocket_groups[pocket]["prediction"].append(cryptobench_prediction[i])
-
-    # compute average prediction for each pocket
-    for pocket in pocket_groups:
-        pocket_groups[pocket]["average_prediction"] = sum(pocket_groups[pocket]["prediction"]) / len(
-            pocket_groups[pocket]["prediction"]
-        )
+    clusters = refine_clusters(clusters, coordinates, embedding_store, sequences_by_chain)
 
-    # region Reassign
-    # after computing the average prediction, sort the pocket groups by the average prediction
-    # and reassign the numbers starting by 1... this is the logic
-    sorted_pockets = sorted(pocket_groups.values(), key=lambda x: x["average_prediction"], reverse=True)
-
-    # create a new pocket_groups dictionary with reassigned IDs
-    pocket_groups = {}
-    for new_id, pocket in enumerate(sorted_pockets, 1):
-        pocket["pocket_id"] = new_id
-        pocket_groups[new_id] = pocket
-
-    # update cluster IDs to match the new pocket numbering
-    id_mapping = {-1: -1}  # keep -1 as is (non-clustered residues)
-    for new_id, pocket in pocket_groups.items():
-        for res_id in pocket["residue_ids"]:
-            # find the residue index in the protein array
-            for i, residue in enumerate(protein):
-                if f"{residue.chain_id}_{residue.res_id}" == res_id:
-                    # map the old cluster ID to the new one
-                    if clusters[i] not in id_mapping:
-                        id_mapping[clusters[i]] = new_id
-                    break
-
-    clusters = [id_mapping.get(c, c) for c in clusters]
-    # endregion
+    # group residues into pockets (numbered by the average prediction)
+    clusters, pockets = group_pockets(clusters, cryptobench_prediction, residue_ids, coordinates)
 
     task_data = {
         "status": "SUCCESS",
         "prediction": cryptobench_prediction,
         "clusters": clusters,
-        "pockets": list(pocket_groups.values()),
+        "pockets": pockets,
         "sequence": list(seq),
-        "residue_ids": [f"{residue.chain_id}_{residue.res_id}" for residue in protein],
+        "residue_ids": residue_ids,
         "input_structure": os.path.basename(structure_file_path),
         "task_id": TASK_ID,
         "file_hash": FILE_HASH[USED_HASH_TYPE],
         "structure_name": structure_name,
+        "results_version": RESULTS_VERSION,
     }
 
     # save the results to a file
@@ -289,10 +224,9 @@ def process_esm2_cryptobench(self, structure_path_original: str, structure_name:
     with open(RESULTS_FALLBACK_FILE, "w") as f:
         json.dump(task_data, f)
 
-    # remove all *.npy files from the job path (embeddings)
-    for file in os.listdir(JOB_PATH):
-        if file.endswith(".npy"):
-            os.remove(os.path.join(JOB_PATH, file))
+    # keep the embeddings for re-clustering, drop them from memory (and remove the spilled ones from the job path)
+    embedding_store.save()
+    embedding_store.clear()
 
     # zip the files to enable download
     RESULTS_ZIP_FILE = os.path.join(JOB_PATH, "results")
@@ -312,6 +246,106 @@ def process_esm2_cryptobench(self, structure_path_original: str, structure_name:
     return task_data
 
 
+def load_job_coordinates(job_path: str, task_data: dict) -> np.ndarray:
+    """Load the CA coordinates of a finished job (ordered chain by chain, the same way as the predictions).
+
+    Jobs finished before the residue table was stored get it built from the saved structure.
+
+    Args:
+        job_path (str): Path to the job directory.
+        task_data (dict): The stored results of the job.
+
+    Returns:
+        np.ndarray: The coordinates of the residues (shape: (N, 3)).
+    """
+    residue_table = load_residue_table(job_path)
+    if residue_table is None:
+        residue_table = build_residue_table(read_structure(os.path.join(job_path, task_data["input_structure"])))
+        save_residue_table(residue_table, job_path)
+
+    _, chain_order, _ = get_chain_order(residue_table)
+    return residue_table["coord"][chain_order]
+
+
+@celery_app.task(name="celery_app.recluster", bind=True)
+def recluster(self, task_hash: str, score_threshold: float, eps: float, min_samples: int):
+    """Re-clusters a finished job with different clustering parameters.
+
+    The stored predictions, coordinates and embeddings are reused, so only DBSCAN, the refinement
+    and the pocket grouping run again; the model never runs. Jobs that did not keep their embeddings
+    are re-clustered without the refinement.
+
+    Args:
+        task_hash (str): The hash identifier of the finished job.
+        score_threshold (float): Only the residues with a higher score are clustered.
+        eps (float): Max distance of two neighboring residues.
+        min_samples (int): Min number of neighbors of a core residue.
+
+    Returns:
+        dict: The results of the job with the new clusters and pockets.
+
+    Raises:
+        FileNotFoundError: If the job has no results.
+    """
+    JOB_PATH = os.path.join(JOBS_BASE_PATH, task_hash)
+    RESULTS_FILE = os.path.join(JOB_PATH, "results.json")
+
+    if not os.path.exists(RESULTS_FILE):
+        raise FileNotFoundError(f"Results for {task_hash} not found")
+
+    with open(RESULTS_FILE, "r") as f:
+        task_data = json.load(f)
+
+    # the residues are stored chain by chain, rebuild the sequences from the residue IDs
+    sequences_by_chain = defaultdict(list)
+    for residue_id, one_letter in zip(task_data["residue_ids"], task_data["sequence"]):
+        sequences_by_chain[residue_id.rsplit("_", 1)[0]].append(one_letter)
+
+    sequences_by_chain = {chain: "".join(seq) for chain, seq in sequences_by_chain.items()}
+
+    coordinates = load_job_coordinates(JOB_PATH, task_data)
+    prediction = task_data["prediction"]
+
+    graph = load_cluster_graph(JOB_PATH)
+    if graph is not None and eps <= graph["max_eps"]:
+        clusters = cluster_with_graph(graph, score_threshold, eps, min_samples)
+    else:
+        clusters = compute_clusters(coordinates, prediction, score_threshold, eps, min_samples)
+    clusters = [int(p) for p in clusters]
+
+    refinement_skipped = False
+    if any(cluster != -1 for cluster in clusters):
+        embedding_store = EmbeddingStore.load(JOB_PATH, list(sequences_by_chain))
+        if embedding_store is not None:
+            self.update_state(state="PROGRESS", meta={"status": "Refining clusters"})
+            clusters = refine_clusters(clusters, coordinates, embedding_store, sequences_by_chain)
+            embedding_store.clear()
+        else:
+            print(f"The embeddings of {task_hash} were not kept, skipping the refinement")
+            refinement_skipped = True
+
+    clusters, pockets = group_pockets(clusters, prediction, task_data["residue_ids"], coordinates)
+
+    task_data.update(
+        {
+            "clusters": clusters,
+            "pockets": pockets,
+            "task_id": self.request.id,
+            "clustering_parameters": {
+                "score_threshold": score_threshold,
+                "eps": eps,
+                "min_samples": min_samples,
+                "refinement_skipped": refinement_skipped,
+            },
+        }
+    )
+
+    with open(os.path.join(JOB_PATH, get_recluster_results_filename(score_threshold, eps, min_samples)), "w") as f:
+        json.dump(task_data, f)
+
+    return task_data
+
+
 @celery_app.task(name="celery_app.generate_trajectory", bind=True)
 def generate_trajectory(self, task_hash: str, aligned_structure_filename: str, target_chains: str):
     """Generates a trajectory for a given aligned structure.
@@ -2,19 +2,14 @@ import hashlib
 import uuid
 import os
 import json
-import shutil
-import requests
 
 from typing import TypedDict
-import biotite.database.rcsb as rcsb
-from Bio.PDB.PDBIO import Select
 
-from commons import JOBS_BASE_PATH
+from commons import JOBS_BASE_PATH, RESULTS_VERSION
 
-
-class FirstModelSelect(Select):
-    def accept_model(self, model):
-        return model.id == 0  # BioPython uses 0-based model indices
+# precision of the re-clustering parameters, nearby values share the same results file
+SCORE_THRESHOLD_DECIMALS = 3
+EPS_DECIMALS = 2
 
 
 class FileHash(TypedDict):
@@ -65,111 +60,82 @@ def generate_random_folder_name() -> str:
     return str(uuid.uuid4())
 
 
-def get_existing_result(file_path: str):
-    """Check if the result for a given file already exists (caching).
+def get_existing_result_by_hash(file_hash: str):
+    """Check if the result for a file with the given MD5 hash already exists (caching).
 
-    It calculates the MD5 hash of the input file and looks for a
-    'results.json' file within a directory named after this hash
-    inside the JOBS_BASE_PATH.
+    Results computed by an older version (see RESULTS_VERSION) are not reused.
 
     Args:
-        file_path: The path to the input file for which to check
-                   existing results.
+        file_hash: The MD5 hex digest of the input file.
 
     Returns:
-        The loaded JSON data as a dictionary if the results file exists,
-        otherwise None. Returns None if the input file doesn't exist.
+        The loaded JSON data as a dictionary if the results file exists
+        and is up to date, otherwise None.
     """
-
-    try:
-        FILE_HASH = get_file_hash(file_path)
-    except FileNotFoundError:
-        # If the input file doesn't exist, no result can exist for it.
-        return None
-
-    TASK_HASH = FILE_HASH["md5"]
-    RESULTS_PATH = os.path.join(JOBS_BASE_PATH, TASK_HASH, "results.json")
+    RESULTS_PATH = os.path.join(JOBS_BASE_PATH, file_hash, "results.json")
 
     if os.path.exists(RESULTS_PATH):
         try:
             with open(RESULTS_PATH, "r") as f:
-                return json.load(f)
+                results = json.load(f)
         except (json.JSONDecodeError, OSError):
             # handle errors in reading the JSON file
             return None
 
+        # the results without a version predate the versioning (version 1)
+        if results.get("results_version", 1) != RESULTS_VERSION:
+            return None
+
+        return results
+
     return None
 
 
-def download_cif_file(pdb_id: str, tmp_dir: str = "") -> str:
-    """Downloads a CIF file from RCSB PDB or AlphaFold database.
+def round_clustering_parameters(score_threshold: float, eps: float) -> tuple[float, float]:
+    """Round the re-clustering parameters to the precision of the results file names.
+
+    Args:
+        score_threshold: Only the residues with a higher score are clustered.
+        eps: Max distance of two neighboring residues.
+
+    Returns:
+        The rounded score threshold and eps (a tiny eps is rounded up, DBSCAN needs a positive eps).
+    """
+    return round(score_threshold, SCORE_THRESHOLD_DECIMALS), max(round(eps, EPS_DECIMALS), 10**-EPS_DECIMALS)
 
-    If the provided `pdb_id` is 4 characters long, it attempts to download
-    the corresponding structure from the RCSB PDB.
-    Otherwise, it assumes the `pdb_id` is a UniProt ID and attempts to
-    download the predicted structure from the AlphaFold database.
 
-    A temporary directory is created if `tmp_dir` is not specified.
-    The directory is removed if the download fails or the fetched file
-    indicates an error (e.g., 404 Not Found).
+def get_recluster_results_filename(score_threshold: float, eps: float, min_samples: int) -> str:
+    """Get the name of the results file of a job re-clustered with the given parameters
+    (see `round_clustering_parameters`). The name contains RESULTS_VERSION, so the files
+    of older versions are not reused.
 
     Args:
-        pdb_id: The identifier for the structure. Expected to be a 4-character
-            PDB ID or a UniProt ID.
-        tmp_dir: The directory path where the CIF file will be saved.
-            If empty or not provided, a temporary directory named with a
-            random UUID will be created. Defaults to "".
+        score_threshold: Only the residues with a higher score are clustered.
+        eps: Max distance of two neighboring residues.
+        min_samples: Min number of neighbors of a core residue.
 
     Returns:
-        The absolute file path to the downloaded CIF file if successful.
-        An empty string ("") if the download fails, the ID is not found,
-        the fetched file content indicates an error, or any other exception occurs.
+        The file name (inside the job directory).
     """
+    return (
+        f"results_v{RESULTS_VERSION}_t{score_threshold:.{SCORE_THRESHOLD_DECIMALS}f}"
+        f"_e{eps:.{EPS_DECIMALS}f}_m{min_samples}.json"
+    )
+
+
+def is_error_page(file_path: str) -> bool:
+    """Check if a downloaded file is an HTTP error page instead of a structure.
+
+    A wrong PDB ID might return an HTML error page.
+
+    Args:
+        file_path: The path to the downloaded file.
+
+    Returns:
+        True if the file starts with an error message, otherwise False.
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(4096)  # error pages are short, structures (also BinaryCIF) never contain these messages
+
+    return b"400 Bad Request" in head or b"404 Not Found" in head
 
-    if not tmp_dir:
-        tmp_dir = os.path.join(JOBS_BASE_PATH, generate_random_folder_name())
-        os.makedirs(tmp_dir, exist_ok=True)
-
-    cif_file_path = ""
-
-    try:
-        if len(pdb_id) == 4:
-            cif_file_path: str = rcsb.fetch(pdb_id, "cif", tmp_dir)  # type: ignore
-            with open(cif_file_path, "r") as f:
-                cif_file_content = f
-                if "400 Bad Request" in cif_file_content.read() or "404 Not Found" in cif_file_content.read():
-                    shutil.rmtree(tmp_dir)
-                    return ""
-
-            return cif_file_path
-
-        uniprot_id = pdb_id
-        cif_file_path = os.path.join(tmp_dir, f"{uniprot_id}.cif")
-        # Assuming pdb_id is a UniProt ID if not 4 characters, try the AlphaFill database
-        # disabled for now...
-        # alphafill_url = f"https://alphafill.eu/v1/aff/{uniprot_id}"
-
-        # response = requests.get(alphafill_url)
-        # if response.status_code == 200:
-        #     with open(cif_file_path, "wb") as f:
-        #         for chunk in response.iter_content(chunk_size=8192):
-        #             f.write(chunk)
-        #     return cif_file_path
-
-        # If AlphaFill doesn't have the file, try AlphaFold
-        alphafold_url = f"https://alphafold.ebi.ac.uk/files/AF-{uniprot_id}-F1-model_v6.cif"
-        cif_file_path = os.path.join(tmp_dir, f"{uniprot_id}.cif")
-
-        response = requests.get(alphafold_url, stream=True)
-        if response.status_code == 200:
-            with open(cif_file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return cif_file_path
-        else:
-            shutil.rmtree(tmp_dir)
-            return ""
-
-    except Exception as e:
-        shutil.rmtree(tmp_dir)
-        return ""
@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+
+from typing import TypedDict
+
+# "throughput" runs many narrow processes, "latency" runs a few wide ones (each job gets more cores)
+CPU_WORKER_TOPOLOGY = os.getenv("CPU_WORKER_TOPOLOGY", "throughput")
+THROUGHPUT_THREADS_PER_PROCESS = int(os.getenv("THROUGHPUT_THREADS_PER_PROCESS", "4"))
+LATENCY_THREADS_PER_PROCESS = int(os.getenv("LATENCY_THREADS_PER_PROCESS", "16"))
+# resident model + activations of a single worker process (fp32 650M ESM-2)
+PROCESS_MEMORY_BYTES = int(os.getenv("WORKER_PROCESS_MEMORY_BYTES", str(6 * 1024**3)))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9101"))
+
+CELERY_BINARY = "/app/.venv/bin/celery"
+
+
+class WorkerTopology(TypedDict):
+    """Process and thread layout of a CPU worker."""
+
+    mode: str
+    processes: int
+    threads_per_process: int
+    cpu_sets: list[list[int]]
+    available_memory_bytes: int
+
+
+def get_available_memory() -> int:
+    """Get the memory available to the worker (the cgroup limit if set, otherwise MemAvailable).
+
+    Returns:
+        The available memory in bytes.
+    """
+    try:
+        with open("/sys/fs/cgroup/memory.max", "r") as f:
+            limit = f.read().strip()
+            if limit != "max":
+                return int(limit)
+    except OSError:
+        pass
+
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024  # the value is in kB
+
+    return 0
+
+
+def compute_topology(mode: str = CPU_WORKER_TOPOLOGY) -> WorkerTopology:
+    """Decide how many worker processes to run and how many threads each of them gets.
+
+    The cores the worker may use are split into disjoint sets, one per process, so that
+    the processes never compete for the same core. The number of processes is also capped
+    by the available memory (every process holds its own copy of the model).
+
+    Args:
+        mode: Either "throughput" or "latency".
+
+    Returns:
+        The chosen layout.
+
+    Raises:
+        ValueError: If the mode is not supported.
+    """
+    if mode not in ("throughput", "latency"):
+        raise ValueError(f"Unsupported CPU_WORKER_TOPOLOGY: {mode}")
+
+    cpus = sorted(os.sched_getaffinity(0))
+    memory = get_available_memory()
+
+    threads_per_process = THROUGHPUT_THREADS_PER_PROCESS if mode == "throughput" else LATENCY_THREADS_PER_PROCESS
+    processes = max(1, len(cpus) // max(1, threads_per_process))
+
+    if memory:
+        processes = max(1, min(processes, memory // PROCESS_MEMORY_BYTES))
+
+    # spread the cores evenly over the processes (the remainder is left to the main process)
+    threads_per_process = max(1, len(cpus) // processes)
+    cpu_sets = [cpus[i * threads_per_process : (i + 1) * threads_per_process] for i in range(processes)]
+
+    return {
+        "mode": mode,
+        "processes": processes,
+        "threads_per_process": threads_per_process,
+        "cpu_sets": cpu_sets,
+        "available_memory_bytes": memory,
+    }
+
+
+def get_current_topology() -> WorkerTopology | None:
+    """Get the layout the worker was started with.
+
+    Returns:
+        The layout if the worker was started through this module, otherwise None.
+    """
+    topology = os.getenv("WORKER_TOPOLOGY")
+    return json.loads(topology) if topology else None
+
+
+def apply_topology(process_index: int) -> None:
+    """Pin the current worker process to its CPU set and size the torch thread pools accordingly.
+
+    Args:
+        process_index: Index of the worker process in the pool (0-based).
+    """
+    topology = get_current_topology()
+    if not topology:
+        return
+
+    import torch
+
+    cpu_set = topology["cpu_sets"][process_index % topology["processes"]]
+    os.sched_setaffinity(0, cpu_set)
+    torch.set_num_threads(len(cpu_set))
+
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can be set only once, before any inter-op work
+
+    print(f"Worker process {process_index} pinned to CPUs {cpu_set}")
+
+
+def start_metrics_server() -> None:
+    """Expose the chosen layout as Prometheus gauges on WORKER_METRICS_PORT."""
+    topology = get_current_topology()
+    if not topology:
+        return
+
+    from prometheus_client import Gauge, Info, start_http_server
+
+    Info("cryptoshow_worker_topology", "Layout of the CPU worker").info({"mode": topology["mode"]})
+    Gauge("cryptoshow_worker_processes", "Number of worker processes").set(topology["processes"])
+    Gauge("cryptoshow_worker_threads_per_process", "Torch threads per worker process").set(
+        topology["threads_per_process"]
+    )
+    Gauge("cryptoshow_worker_available_memory_bytes", "Memory available to the worker").set(
+        topology["available_memory_bytes"]
+    )
+
+    start_http_server(WORKER_METRICS_PORT)
+
+
+if __name__ == "__main__":
+    # Usage: python -m worker_topology [additional celery worker arguments]
+    topology = compute_topology()
+    print(f"CPU worker topology: {json.dumps(topology)}")
+
+    # these are read by the OpenMP/MKL runtimes when torch is first imported in the worker processes
+    threads = str(topology["threads_per_process"])
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    os.environ["WORKER_TOPOLOGY"] = json.dumps(topology)
+
+    os.execv(
+        CELERY_BINARY,
+        [
+            CELERY_BINARY,
+            "-A",
+            "tasks.celery_app",
+            "worker",
+            "--pool=prefork",
+            f"--concurrency={topology['processes']}",
+            *sys.argv[1:],
+        ],
+    )